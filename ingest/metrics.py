@@ -0,0 +1,149 @@
+from typing import Dict, List, Sequence, Tuple
+from bisect import bisect_left
+import math, threading
+
+# Minimal Prometheus text-format metrics for the inference service.
+# Recording a histogram value is a thread-local lookup, a bisect and two
+# list increments (no lock); all aggregation and formatting happens in
+# `render()`, i.e. only when something scrapes /metrics.
+
+LATENCY_BUCKETS = (25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 1.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _fmt(v: float) -> str:
+    return "+Inf" if v == math.inf else repr(float(v))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _HistogramChild:
+    """Bucket counts sharded per thread: a thread only ever writes its own
+    shard, so `observe` takes no lock; `snapshot` sums the shards."""
+    __slots__ = ("bounds", "shards", "local", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.shards: List[List[float]] = []  # [count per bucket..., +Inf count, sum]
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def _shard(self) -> List[float]:
+        shard = self.local.shard = [0] * (len(self.bounds) + 1) + [0.0]
+        with self.lock:
+            self.shards.append(shard)
+        return shard
+
+    def observe(self, value: float) -> None:
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self._shard()
+        shard[bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self.lock:
+            shards = list(self.shards)
+        totals = [sum(col) for col in zip(*shards)] if shards else [0] * (len(self.bounds) + 2)
+        return totals[:-1], float(totals[-1])
+
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        # labels() may add a child while a scrape renders
+        with self._lock:
+            items = list(self._children.items())
+        return sorted(items)
+
+    def labels(self, *values: str):
+        try:
+            return self._children[values]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(values, self._new_child())
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def render(self) -> List[str]:
+        out = []
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                le = 'le="%s"' % _fmt(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, values)} {repr(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, values)} {acc}")
+        return out
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, values)} {_fmt(child.value)}"
+                for values, child in self._items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def histogram(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        m = Histogram(name, doc, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        m = Counter(name, doc, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.doc}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
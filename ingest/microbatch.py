@@ -0,0 +1,98 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+
+# Request coalescer: concurrent callers await `submit`, a single worker task
+# drains the queue into batches and runs the model once per batch off the
+# event loop.
+
+
+class MicroBatcher:
+    """Gather up to `max_batch_size` items or wait at most `max_wait_ms`, then call `run_batch` once.
+
+    `run_batch(items) -> results` must return one result per item, in order.
+    It runs on a dedicated single-thread executor so forward passes never
+    overlap and never block the event loop.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="microbatch")
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+        self._size_hist: Dict[int, int] = {}  # power-of-two bucket -> batches
+        self._last_run_ms = 0.0
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._loop())
+        return self._queue
+
+    async def submit(self, item: Any) -> Any:
+        fut = asyncio.get_running_loop().create_future()
+        await self._ensure_worker().put((item, fut))
+        return await fut
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        q = self._queue
+        batch = [await q.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            if not q.empty():
+                batch.append(q.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(q.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.run_batch, items)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            finally:
+                self._record(len(batch), time.perf_counter() - t0)
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+    def _record(self, n: int, seconds: float) -> None:
+        self._batches += 1
+        self._items += n
+        self._max_seen = max(self._max_seen, n)
+        bucket = 1 << (n - 1).bit_length()
+        self._size_hist[bucket] = self._size_hist.get(bucket, 0) + 1
+        self._last_run_ms = seconds * 1000.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": (self._items / self._batches) if self._batches else 0.0,
+            "max_batch_seen": self._max_seen,
+            "batch_size_hist": {f"<={k}": v for k, v in sorted(self._size_hist.items())},
+            "last_batch_ms": self._last_run_ms,
+        }
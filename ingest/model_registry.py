@@ -0,0 +1,96 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import pathlib, threading, time
+
+# Per-link model registry for the artefacts written by the per-link trainers:
+#   models/lstm/<target>/<src>_<dst>.pt
+#   models/arima/<target>/<src>_<dst>.pkl
+# The directories are indexed at startup (paths only); a link's model is
+# loaded on its first request and kept in a bounded LRU.
+
+Key = Tuple[str, str, str]  # (kind, target, "<src>_<dst>")
+
+
+def link_id(src: str, dst: str) -> str:
+    return f"{src}_{dst}"  # same naming as the trainers' output files
+
+
+class ModelRegistry:
+    def __init__(self, models_dir: pathlib.Path, loaders: Dict[str, Tuple[str, Callable[[pathlib.Path], Any]]],
+                 max_loaded: int = 256, on_load: Optional[Callable[[str, float], None]] = None):
+        """`loaders` maps kind -> (file suffix, loader(path) -> model); `on_load(kind, seconds)` is called after each load."""
+        self.models_dir, self.loaders, self.on_load = models_dir, loaders, on_load
+        self.max_loaded = max(1, int(max_loaded))
+        self._index: Dict[Key, Tuple[pathlib.Path, int]] = {}
+        self._loaded: "OrderedDict[Key, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Key, threading.Lock] = {}
+        self.hits = self.loads = self.evictions = 0
+        self.refresh()
+
+    def refresh(self) -> int:
+        """Re-index the model directories; loaded models whose file changed are dropped."""
+        index: Dict[Key, Tuple[pathlib.Path, int]] = {}
+        for kind, (suffix, _) in self.loaders.items():
+            for path in (self.models_dir / kind).glob(f"*/*{suffix}"):
+                index[(kind, path.parent.name, path.stem)] = (path, path.stat().st_mtime_ns)
+        with self._lock:
+            self._index = index
+            for key in [k for k, (mtime, _) in self._loaded.items() if index.get(k, (None, None))[1] != mtime]:
+                del self._loaded[key]
+        return len(index)
+
+    def links(self, kind: str, target: Optional[str] = None) -> List[Key]:
+        return sorted(k for k in self._index if k[0] == kind and (target is None or k[1] == target))
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._index
+
+    def get(self, kind: str, target: str, src: str, dst: str) -> Any:
+        return self._get((kind, target, link_id(src, dst)))
+
+    def _get(self, key: Key) -> Any:
+        kind = key[0]
+        with self._lock:
+            hit = self._loaded.get(key)
+            if hit is not None:
+                self._loaded.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            if key not in self._index:
+                raise KeyError(f"no {kind} model for target={key[1]} link={key[2]}")
+            path, mtime = self._index[key]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        # load outside the registry lock; concurrent first requests for one link wait on a per-key lock
+        with load_lock:
+            with self._lock:
+                hit = self._loaded.get(key)
+                if hit is not None:
+                    return hit[1]
+            t0 = time.perf_counter()
+            model = self.loaders[kind][1](path)
+            if self.on_load is not None:
+                self.on_load(kind, time.perf_counter() - t0)
+            with self._lock:
+                self._loaded[key] = (mtime, model)
+                self._loaded.move_to_end(key)
+                self.loads += 1
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+                    self.evictions += 1
+                self._loading.pop(key, None)
+        return model
+
+    def preload(self, kind: str) -> int:
+        """Load up to `max_loaded` models of one kind ahead of their first request."""
+        keys = self.links(kind)[: self.max_loaded]
+        for key in keys:
+            self._get(key)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        per_kind: Dict[str, int] = {}
+        for kind, _, _ in self._index:
+            per_kind[kind] = per_kind.get(kind, 0) + 1
+        return {"indexed": per_kind, "loaded": len(self._loaded), "max_loaded": self.max_loaded,
+                "hits": self.hits, "loads": self.loads, "evictions": self.evictions}
@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Optional, Tuple
+import math, threading
+import pandas as pd
+
+# Server-side counterpart of scripts/make_features.py::add_lags_and_rollups.
+# Clients post the latest gold window per link; the lag and rolling columns
+# are derived from per-(src_node, dst_node) ring buffers kept here.
+
+TARGETS = ["sum_energy_Wh", "sum_duration_s"]  # same targets as make_features.py
+NON_FEATURE_COLS = {"split", "window_start_ts", "window_end_ts", "ingested_at_ts", "date"}
+
+
+class _LinkState:
+    __slots__ = ("buffers", "pos", "count", "last_ts")
+
+    def __init__(self, targets: List[str], cap: int):
+        self.buffers = {t: [math.nan] * cap for t in targets}
+        self.pos = 0      # slot the next value goes into
+        self.count = 0    # values seen, capped at cap
+        self.last_ts: Optional[pd.Timestamp] = None
+
+
+class OnlineFeatureState:
+    """Per-link ring buffers of the gold targets.
+
+    Each buffer holds the last max(max_lag, rolling) values, so an update is
+    constant work per link regardless of history length. Lags are read from
+    the buffer before the new value is pushed (lag_k = k rows back, NaN when
+    the link has fewer rows), the rolling stats cover the last `rolling`
+    values including the new one, exactly like the offline pipeline.
+    """
+
+    def __init__(self, max_lag: int, rolling: int, targets: List[str] = TARGETS):
+        self.max_lag, self.rolling, self.targets = int(max_lag), int(rolling), list(targets)
+        # one spare slot so a re-posted window can be replaced without losing history
+        self.cap = max(self.max_lag, self.rolling, 1) + 1
+        self._links: Dict[Tuple[str, str], _LinkState] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+    def _back(self, st: _LinkState, t: str, k: int) -> float:
+        # k-th most recent value (k=1 is the newest) or NaN
+        if k > st.count:
+            return math.nan
+        return st.buffers[t][(st.pos - k) % self.cap]
+
+    def _rolling(self, st: _LinkState, t: str) -> Tuple[float, float]:
+        # same accumulation order as make_features.rolling_mean_std (oldest first)
+        window = [self._back(st, t, k) for k in range(self.rolling, 0, -1)]
+        n, total = 0, 0.0
+        for v in window:
+            if v == v:
+                n += 1
+                total += v
+        if n == 0:
+            return math.nan, math.nan
+        mean = total / n
+        ssq = 0.0
+        for v in window:
+            d = v - mean if v == v else 0.0
+            ssq += d * d
+        return mean, (math.sqrt(ssq / (n - 1)) if n > 1 else math.nan)
+
+    def update(self, obs: Dict[str, Any]) -> Dict[str, Any]:
+        """Push one gold window and return its offline-equivalent feature row."""
+        try:
+            key = (str(obs["src_node"]), str(obs["dst_node"]))
+            ts = pd.Timestamp(obs["window_start_ts"])
+        except KeyError as e:
+            raise ValueError(f"observation is missing {e.args[0]!r}")
+        values = {}
+        for t in self.targets:
+            v = obs.get(t)
+            values[t] = math.nan if v is None else float(v)
+
+        with self._lock:
+            st = self._links.get(key)
+            if st is None:
+                st = self._links[key] = _LinkState(self.targets, self.cap)
+            if st.last_ts is not None:
+                if ts < st.last_ts:
+                    raise ValueError(f"window {ts} is older than the last one seen for {key} ({st.last_ts})")
+                if ts == st.last_ts:
+                    # re-posted window: replace the newest value instead of shifting
+                    st.pos = (st.pos - 1) % self.cap
+                    st.count -= 1
+            row = dict(obs)
+            for t in self.targets:
+                for lag in range(1, self.max_lag + 1):
+                    row[f"{t}_lag_{lag}"] = self._back(st, t, lag)
+                st.buffers[t][st.pos] = values[t]
+            st.pos = (st.pos + 1) % self.cap
+            st.count = min(st.count + 1, self.cap)
+            st.last_ts = ts
+            if self.rolling > 0:
+                for t in self.targets:
+                    row[f"{t}_roll_mean"], row[f"{t}_roll_std"] = self._rolling(st, t)
+
+        row["hour"], row["dow"], row["month"] = ts.hour, ts.dayofweek, ts.month
+        return row
+
+
+def to_model_row(row: Dict[str, Any]) -> Dict[str, float]:
+    """Apply the train_xgb.py design-matrix steps (one-hot links, NaN -> 0) to a feature row."""
+    out: Dict[str, float] = {}
+    for k, v in row.items():
+        if k in NON_FEATURE_COLS or k in ("src_node", "dst_node"):
+            continue
+        if not isinstance(v, (int, float)):
+            continue
+        out[k] = 0.0 if v != v else float(v)
+    out[f"src_node_{row['src_node']}"] = 1.0
+    out[f"dst_node_{row['dst_node']}"] = 1.0
+    return out
@@ -1,7 +1,18 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.exception_handlers import http_exception_handler, request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
-import json, joblib, pathlib, torch
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import hashlib, json, joblib, os, pathlib, threading, time, yaml
+from ingest.predictors import SklearnPredictor, LSTMPredictor, ArimaForecaster, ArimaObservations, load_onnx_predictor
+from ingest.online_features import OnlineFeatureState, to_model_row
+from ingest.microbatch import MicroBatcher
+from ingest.model_registry import ModelRegistry
+from ingest.metrics import MetricsRegistry, SIZE_BUCKETS
 """
 To test a curl request:
 uvicorn predict_xgb_lstm:app --host 0.0.0.0 --port 8000
@@ -23,43 +34,232 @@ curl -X POST http://localhost:3000/predict \
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 
+def load_params() -> dict:
+    path = pathlib.Path(os.getenv("PARAMS_PATH", ROOT / "params.yaml"))
+    if not path.exists():
+        return {}
+    return yaml.safe_load(path.read_text()) or {}
+
+PARAMS = load_params()
+
+# --- Metrics (scraped from /metrics) ---
+# Link-level models are labelled model_type="link_lstm" / "link_arima".
+METRICS = MetricsRegistry()
+STAGE_SECONDS = METRICS.histogram("ecomep_stage_seconds", "Seconds per request stage (parse, features, model, serialize).",
+                                  ("stage", "model_type"))
+BATCH_SIZE = METRICS.histogram("ecomep_batch_size", "Rows/windows per batched model call.", ("model_type",),
+                               buckets=SIZE_BUCKETS)
+MODEL_LOAD_SECONDS = METRICS.histogram("ecomep_model_load_seconds", "Seconds to load a model from disk.", ("model_type",),
+                                       buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0))
+ERRORS = METRICS.counter("ecomep_errors_total", "Requests answered with an error status.", ("route", "status"))
+
+def _observe(model_type: str, timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage, model_type).observe(seconds)
+
 # --- Champion loader ---
-class SklearnPredictor:
-    def __init__(self, bundle):
-        self.model = bundle["model"]
-        self.features = bundle.get("feature_names", [])
-    def predict(self, row: Dict[str, Any]) -> float:
-        import pandas as pd
-        X = pd.DataFrame([row])
-        # pad known features
-        for c in self.features:
-            if c not in X: X[c] = 0.0
-        X = X[self.features] if self.features else X
-        return float(self.model.predict(X)[0])
-
-class LSTMPredictor:
-    def __init__(self, model_path: pathlib.Path):
-        ckpt = torch.load(model_path, map_location="cpu")
-        from scripts.train_lstm import LSTMReg
-        self.model = LSTMReg(ckpt["in_features"], 128, 2, 0.1)
-        self.model.load_state_dict(ckpt["state_dict"])
-        self.model.eval()
-    def predict(self, window_2d: List[List[float]]) -> float:
-        x = torch.tensor([window_2d], dtype=torch.float32)
-        with torch.no_grad():
-            y = self.model(x).cpu().numpy()[0]
-        return float(y)
-
-def load_champion():
-    meta = json.loads((ROOT/"models"/"champion.json").read_text())
+CHAMPION_PATH = ROOT/"models"/"champion.json"
+
+def load_champion(meta: Optional[dict] = None):
+    meta = meta if meta is not None else json.loads(CHAMPION_PATH.read_text())
     mtype, mpath = meta["model_type"], ROOT / meta["model_path"]
     if mtype in ("xgboost", "sklearn"):
         return mtype, SklearnPredictor(joblib.load(mpath))
     elif mtype == "lstm":
-        return mtype, LSTMPredictor(mpath)
+        return mtype, LSTMPredictor(mpath, PARAMS.get("lstm"))
+    elif mtype == "onnx":
+        return mtype, load_onnx_predictor(mpath)
     raise RuntimeError(f"Unsupported model_type: {mtype}")
 
-MODEL_TYPE, PREDICTOR = load_champion()
+class Champion:
+    """Immutable snapshot of a loaded champion; requests hold on to one for their whole lifetime."""
+    __slots__ = ("version", "meta", "model_type", "predictor", "signature", "loaded_at")
+    def __init__(self, version: int, meta: dict, model_type: str, predictor, signature: Tuple, loaded_at: float):
+        self.version, self.meta, self.model_type = version, meta, model_type
+        self.predictor, self.signature, self.loaded_at = predictor, signature, loaded_at
+
+class ChampionManager:
+    """Caches champion.json and hot-swaps the predictor when it (or the model file) changes.
+
+    A reload builds the new predictor off to the side and then replaces
+    `current` in one assignment, so in-flight requests finish on the snapshot
+    they started with. A failed reload keeps serving the previous champion.
+    """
+    def __init__(self, path: pathlib.Path, poll_s: float = 0.0):
+        self.path, self.poll_s = path, poll_s
+        self.current: Optional[Champion] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def _signature(self, meta: Optional[dict] = None) -> Tuple:
+        sig = [self.path.stat().st_mtime_ns]
+        if meta is not None:
+            mpath = ROOT / meta["model_path"]
+            sig.append(mpath.stat().st_mtime_ns if mpath.exists() else None)
+        return tuple(sig)
+
+    def _changed(self) -> bool:
+        cur = self.current
+        if cur is None:
+            return True
+        try:
+            meta = cur.meta if self._signature()[0] == cur.signature[0] else json.loads(self.path.read_text())
+            return self._signature(meta) != cur.signature
+        except (OSError, ValueError, KeyError):
+            return False  # half-written champion.json; look again on the next poll
+
+    def reload(self, force: bool = False) -> bool:
+        """Load the champion if it changed on disk; returns True when a new one was swapped in."""
+        with self._lock:
+            if not force and not self._changed():
+                return False
+            try:
+                meta = json.loads(self.path.read_text())
+                sig = self._signature(meta)
+                t0 = time.perf_counter()
+                mtype, predictor = load_champion(meta)
+                MODEL_LOAD_SECONDS.labels(mtype).observe(time.perf_counter() - t0)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if self.current is None:
+                    raise
+                return False
+            version = self.current.version + 1 if self.current else 1
+            self.current = Champion(version, meta, mtype, predictor, sig, time.time())
+            self.last_error = None
+            return True
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_s):
+            self.reload()
+
+    def start(self) -> None:
+        if self.poll_s > 0 and self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="champion-watch", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+MANAGER = ChampionManager(CHAMPION_PATH, poll_s=float(os.getenv("CHAMPION_POLL_S", "10")))
+MANAGER.reload(force=True)
+
+# --- LSTM request coalescing ---
+# Concurrent /predict calls are stacked into one [B, T, F] forward pass.
+# Items are (predictor, window, model_type) and carry the predictor they were
+# submitted against, so a hot swap never mixes windows from two champions in
+# one forward pass.
+def _run_window_batch(items: List[Tuple[Any, Any, str]]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    groups: Dict[int, Tuple[Any, str, List[int]]] = {}
+    for i, (predictor, _, model_type) in enumerate(items):
+        groups.setdefault(id(predictor), (predictor, model_type, []))[2].append(i)
+    for predictor, model_type, idx in groups.values():
+        timings: Dict[str, float] = {}
+        for i, res in zip(idx, predictor.predict_batch([items[i][1] for i in idx], timings)):
+            results[i] = res
+        _observe(model_type, timings)
+        BATCH_SIZE.labels(model_type).observe(len(idx))
+    return results
+
+LSTM_MICROBATCH = os.getenv("LSTM_MICROBATCH", "true").lower() == "true"
+BATCHER = MicroBatcher(
+    _run_window_batch,
+    max_batch_size=int(os.getenv("LSTM_MAX_BATCH", "32")),
+    max_wait_ms=float(os.getenv("LSTM_MAX_WAIT_MS", "2")),
+)
+
+# --- Per-link models (models/<kind>/<target>/<src>_<dst>.*), loaded on first use ---
+# observations posted to /forecast/.../observations outlive the LRU: a reloaded ARIMA model replays them
+ARIMA_OBSERVATIONS = ArimaObservations()
+REGISTRY = ModelRegistry(
+    ROOT/"models",
+    loaders={
+        "lstm": (".pt", lambda path: LSTMPredictor(path, PARAMS.get("lstm"))),
+        "arima": (".pkl", lambda path: ArimaForecaster(path, ARIMA_OBSERVATIONS)),
+    },
+    max_loaded=int(os.getenv("REGISTRY_MAX_MODELS", "256")),
+    on_load=lambda kind, seconds: MODEL_LOAD_SECONDS.labels(f"link_{kind}").observe(seconds),
+)
+
+# --- Online feature state (lags/rollups kept server-side) ---
+_fp = PARAMS.get("features", {})
+ONLINE_STATE = OnlineFeatureState(max_lag=int(_fp.get("max_lag", 12)), rolling=int(_fp.get("rolling", 12)))
+
+# --- Prediction cache ---
+class PredictionCache:
+    """Bounded LRU of prediction responses with a TTL.
+
+    Entries are tagged with the champion version that produced them; the
+    first lookup after a hot swap drops everything. Requests still running
+    on an older champion neither read nor write the cache.
+    """
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries, self.ttl_s = max_entries, ttl_s
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(route: str, payload: Any) -> str:
+        blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.blake2b(f"{route}|{blob}".encode(), digest_size=16).hexdigest()
+
+    def _check_version(self, version: int) -> bool:
+        """Move to a newer champion version; False if `version` is older than the current one."""
+        if self._version is None or version > self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._version = version
+        return version == self._version
+
+    def get(self, key: str, version: int) -> Optional[Any]:
+        with self._lock:
+            hit = self._data.get(key) if self._check_version(version) else None
+            if hit is None or hit[0] < time.monotonic():
+                if hit is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def put(self, key: str, version: int, value: Any) -> None:
+        with self._lock:
+            if not self._check_version(version):
+                return  # computed by a champion swapped out meanwhile
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"enabled": self.enabled, "entries": len(self._data), "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations}
+
+# Off by default; the TTL defaults to one gold window so a cached forecast
+# never outlives the window it was computed for.
+CACHE = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "0")),
+    ttl_s=float(os.getenv("PREDICTION_CACHE_TTL_S", 60 * float(PARAMS.get("data", {}).get("window_minutes", 5)))),
+)
 
 # --- API schema ---
 class TabularRequest(BaseModel):
@@ -68,23 +268,235 @@ class TabularRequest(BaseModel):
 class SequenceRequest(BaseModel):
     window: List[List[float]] = Field(..., description="[timesteps][features] window")
 
-app = FastAPI(title="ECoMEP Inference API", version="1.0")
+@asynccontextmanager
+async def lifespan(_app):
+    MANAGER.start()
+    # e.g. REGISTRY_PRELOAD=arima: unpickle per-link models in the background before traffic needs them
+    for kind in filter(None, os.getenv("REGISTRY_PRELOAD", "").split(",")):
+        threading.Thread(target=REGISTRY.preload, args=(kind.strip(),), name=f"preload-{kind}", daemon=True).start()
+    yield
+    MANAGER.stop()
+
+app = FastAPI(title="ECoMEP Inference API", version="1.0", lifespan=lifespan)
+
+# --- Error counting ---
+def _route(request: Request) -> str:
+    # the route template, not the raw path, so per-link URLs don't explode the label set
+    return getattr(request.scope.get("route"), "path", "unmatched")
+
+@app.exception_handler(StarletteHTTPException)
+async def _count_http_error(request: Request, exc: StarletteHTTPException):
+    ERRORS.labels(_route(request), str(exc.status_code)).inc()
+    return await http_exception_handler(request, exc)
+
+@app.exception_handler(RequestValidationError)
+async def _count_validation_error(request: Request, exc: RequestValidationError):
+    ERRORS.labels(_route(request), "422").inc()
+    return await request_validation_exception_handler(request, exc)
+
+@app.exception_handler(Exception)
+async def _count_server_error(request: Request, exc: Exception):
+    ERRORS.labels(_route(request), "500").inc()
+    return Response("Internal Server Error", status_code=500, media_type="text/plain")
+
+# --- Request parsing / serialization (timed; FastAPI's own body handling can't be) ---
+async def _read_json(request: Request, model_type: str) -> Dict[str, Any]:
+    body = await request.body()
+    t0 = time.perf_counter()
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(400, "Request body is not valid JSON.")
+    if not isinstance(payload, dict):
+        raise HTTPException(400, "Request body must be a JSON object.")
+    STAGE_SECONDS.labels("parse", model_type).observe(time.perf_counter() - t0)
+    return payload
+
+def _json_response(out: Any, model_type: str) -> Response:
+    t0 = time.perf_counter()
+    body = json.dumps(out, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    STAGE_SECONDS.labels("serialize", model_type).observe(time.perf_counter() - t0)
+    return Response(body, media_type="application/json")
+
+@app.get("/metrics")
+def metrics():
+    return Response(METRICS.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
-def health(): return {"status": "ok", "model_type": MODEL_TYPE}
+def health(): return {"status": "ok", "model_type": MANAGER.current.model_type}
 
 @app.get("/model")
 def model_info():
-    meta = json.loads((ROOT/"models"/"champion.json").read_text())
-    return meta
+    return MANAGER.current.meta
+
+@app.post("/admin/reload")
+async def admin_reload(force: bool = False):
+    """Re-read champion.json and swap in the new predictor once it has loaded; re-index per-link models."""
+    swapped = await run_in_threadpool(MANAGER.reload, force)
+    indexed = await run_in_threadpool(REGISTRY.refresh)
+    champ = MANAGER.current
+    return {"reloaded": swapped, "version": champ.version, "model_type": champ.model_type,
+            "loaded_at": champ.loaded_at, "error": MANAGER.last_error, "link_models": indexed}
 
 @app.post("/predict")
-def predict(payload: Dict[str, Any]):
-    if MODEL_TYPE in ("xgboost","sklearn"):
+async def predict(request: Request):
+    champ = MANAGER.current
+    payload = await _read_json(request, champ.model_type)
+    if not CACHE.enabled:
+        return _json_response(await _predict(champ, payload), champ.model_type)
+    key = CACHE.key("predict", payload)
+    out = CACHE.get(key, champ.version)
+    if out is None:
+        out = await _predict(champ, payload)
+        CACHE.put(key, champ.version, out)
+    return _json_response(out, champ.model_type)
+
+async def _predict(champ: Champion, payload: Dict[str, Any]) -> Dict[str, Any]:
+    if champ.predictor.kind == "tabular":
         if "features" not in payload:
             raise HTTPException(400, "Expected {'features': {...}} for tabular model.")
-        return {"power_forecast": PREDICTOR.predict(payload["features"])}
-    elif MODEL_TYPE == "lstm":
+        if not isinstance(payload["features"], dict):
+            raise HTTPException(400, "Invalid features: expected a flat feature dict")
+        timings: Dict[str, float] = {}
+        try:
+            y, unknown = await run_in_threadpool(champ.predictor.predict_row, payload["features"], timings)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(400, f"Invalid feature value: {e}")
+        _observe(champ.model_type, timings)
+        out = {"power_forecast": y}
+        if unknown:
+            out["unknown_features"] = unknown
+        return out
+    elif champ.predictor.kind == "sequence":
         if "window" not in payload:
             raise HTTPException(400, "Expected {'window': [[...],[...],...]} for LSTM model.")
-        return {"power_forecast": PREDICTOR.predict(payload["window"])}
+        if LSTM_MICROBATCH:
+            res = await BATCHER.submit((champ.predictor, payload["window"], champ.model_type))
+        else:
+            res = (await run_in_threadpool(_run_window_batch, [(champ.predictor, payload["window"], champ.model_type)]))[0]
+        if "error" in res:
+            raise HTTPException(400, f"Invalid window: {res['error']}")
+        return res
+
+@app.get("/cache/stats")
+def cache_stats():
+    return CACHE.stats()
+
+@app.get("/batcher/stats")
+def batcher_stats():
+    return {"enabled": MANAGER.current.predictor.kind == "sequence" and LSTM_MICROBATCH, **BATCHER.stats()}
+
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    """Score N rows/windows with a single model call; results keep request order."""
+    champ = MANAGER.current
+    payload = await _read_json(request, champ.model_type)
+    if champ.predictor.kind == "tabular":
+        field = "features"
+        if not isinstance(payload.get(field), list):
+            raise HTTPException(400, "Expected {'features': [{...}, ...]} for tabular model.")
+    elif champ.predictor.kind == "sequence":
+        field = "windows"
+        if not isinstance(payload.get(field), list):
+            raise HTTPException(400, "Expected {'windows': [[[...],...], ...]} for LSTM model.")
+    timings: Dict[str, float] = {}
+    results = await run_in_threadpool(champ.predictor.predict_batch, payload[field], timings)
+    _observe(champ.model_type, timings)
+    BATCH_SIZE.labels(champ.model_type).observe(len(payload[field]))
+    return _json_response({"results": results}, champ.model_type)
+
+@app.post("/predict_online")
+async def predict_online(request: Request):
+    """Post the latest gold window of a link; lag/rolling features come from server-side state."""
+    champ = MANAGER.current
+    if champ.predictor.kind != "tabular":
+        raise HTTPException(400, "Online features are only available for tabular champions.")
+    payload = await _read_json(request, champ.model_type)
+    obs = payload.get("observation")
+    if not isinstance(obs, dict):
+        raise HTTPException(400, "Expected {'observation': {'src_node': ..., 'dst_node': ..., 'window_start_ts': ..., ...}}.")
+    # the state update runs on every request, cached or not: it enforces window order and keeps
+    # the link's ring buffer in step with what the client sent
+    try:
+        row, model_row, timings = await run_in_threadpool(_online_row, obs)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(400, str(e))
+    out = {"src_node": row["src_node"], "dst_node": row["dst_node"], "window_start_ts": str(obs["window_start_ts"])}
+    key = CACHE.key("predict_online", {"features": model_row, **out}) if CACHE.enabled else None
+    if key is not None:
+        cached = CACHE.get(key, champ.version)
+        if cached is not None:
+            return _json_response(cached, champ.model_type)
+    y, _ = await run_in_threadpool(champ.predictor.predict_row, model_row, timings)
+    _observe(champ.model_type, timings)
+    out = {"power_forecast": y, **out}
+    if key is not None:
+        CACHE.put(key, champ.version, out)
+    return _json_response(out, champ.model_type)
+
+def _online_row(obs: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float], Dict[str, float]]:
+    t0 = time.perf_counter()
+    row = ONLINE_STATE.update(obs)
+    model_row = to_model_row(row)
+    return row, model_row, {"features": time.perf_counter() - t0}
+
+@app.get("/registry/stats")
+def registry_stats():
+    return REGISTRY.stats()
+
+@app.get("/links")
+def list_links(kind: str = "lstm", target: Optional[str] = None):
+    return {"links": [{"kind": k, "target": t, "link": l} for k, t, l in REGISTRY.links(kind, target)]}
+
+@app.post("/links/{src}/{dst}/predict")
+async def predict_link(src: str, dst: str, payload: Dict[str, Any], target: str = "sum_energy_Wh"):
+    """Score a recent window of one link with that link's own LSTM (loaded on first use)."""
+    window = payload.get("window")
+    if not isinstance(window, list) or not window:
+        raise HTTPException(400, "Expected {'window': [v1, v2, ...]} (or [[v1], [v2], ...]).")
+    try:
+        predictor = await run_in_threadpool(REGISTRY.get, "lstm", target, src, dst)
+    except KeyError as e:
+        raise HTTPException(404, str(e.args[0]))
+    if not isinstance(window[0], list):
+        window = [[v] for v in window]  # per-link models are univariate
+    if LSTM_MICROBATCH:
+        res = await BATCHER.submit((predictor, window, "link_lstm"))
+    else:
+        res = (await run_in_threadpool(_run_window_batch, [(predictor, window, "link_lstm")]))[0]
+    if "error" in res:
+        raise HTTPException(400, f"Invalid window: {res['error']}")
+    return {"src_node": src, "dst_node": dst, "target": target, **res}
+
+ARIMA_MAX_STEPS = int(os.getenv("ARIMA_MAX_STEPS", "288"))
+
+def _arima(src: str, dst: str, target: str) -> ArimaForecaster:
+    try:
+        return REGISTRY.get("arima", target, src, dst)
+    except KeyError as e:
+        raise HTTPException(404, str(e.args[0]))
+
+@app.get("/forecast/{src}/{dst}")
+def forecast_link(src: str, dst: str, target: str = "sum_energy_Wh", steps: int = Query(12, ge=1)):
+    """Multi-step forecast from the link's cached ARIMA state (no unpickling, no refit)."""
+    if steps > ARIMA_MAX_STEPS:
+        raise HTTPException(400, f"steps must be <= {ARIMA_MAX_STEPS}")
+    model = _arima(src, dst, target)
+    t0 = time.perf_counter()
+    forecast = model.forecast(steps)
+    STAGE_SECONDS.labels("model", "link_arima").observe(time.perf_counter() - t0)
+    return {"src_node": src, "dst_node": dst, "target": target, "steps": steps, "forecast": forecast,
+            "appended_total": model.appended}
+
+@app.post("/forecast/{src}/{dst}/observations")
+def observe_link(src: str, dst: str, payload: Dict[str, Any], target: str = "sum_energy_Wh"):
+    """Append newly observed gold values (oldest first) to the link's ARIMA state without refitting."""
+    values = payload.get("values")
+    if not isinstance(values, list) or not values:
+        raise HTTPException(400, "Expected {'values': [v1, v2, ...]} in time order.")
+    model = _arima(src, dst, target)
+    try:
+        appended = model.observe(values)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(400, f"Could not append observations: {e}")
+    return {"src_node": src, "dst_node": dst, "target": target, "appended_total": appended}
@@ -0,0 +1,290 @@
+from typing import List, Dict, Any, Optional, Tuple
+from time import perf_counter
+import json, pathlib, threading, warnings
+import numpy as np
+
+# Model wrappers used by the inference API (ingest/predict_xgb_lstm.py).
+# Kept free of FastAPI/champion state so they can be imported by benchmarks.
+# torch and onnxruntime are imported lazily so an ONNX-only deployment never
+# pays for the torch import at cold start.
+# Calls that take a `timings` dict add the seconds spent assembling the input
+# ("features") and inside the model ("model") to it.
+
+
+def _add(timings: Dict[str, float], stage: str, seconds: float) -> None:
+    timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class SklearnPredictor:
+    """Tabular champion (XGBoost sklearn wrapper or any sklearn regressor).
+
+    The feature layout is compiled once: `index` maps a feature name to its
+    column, requests are written straight into a float32 row buffer (one per
+    worker thread) and the booster is called on that array. Missing features
+    are padded with 0.0; unknown keys are returned to the caller.
+    """
+    kind = "tabular"
+
+    def __init__(self, bundle):
+        self.model = bundle["model"]
+        self._compile_layout(bundle.get("feature_names", []))
+        get_booster = getattr(self.model, "get_booster", None)
+        self._booster = get_booster() if get_booster else None
+        # the trees model.predict would use: up to best_iteration after early stopping, else all (0, 0)
+        best = getattr(self.model, "best_iteration", None) if self._booster is not None else None
+        self._iteration_range = (0, int(best) + 1) if best is not None else (0, 0)
+
+    def _compile_layout(self, features: List[str]) -> None:
+        self.features = list(features)
+        self.index = {c: j for j, c in enumerate(self.features)}
+        self._local = threading.local()
+
+    def _row_buffer(self) -> np.ndarray:
+        buf = getattr(self._local, "row", None)
+        if buf is None:
+            buf = self._local.row = np.zeros((1, len(self.features)), dtype=np.float32)
+        return buf
+
+    def _fill(self, row: Dict[str, Any], out: np.ndarray) -> List[str]:
+        out.fill(0.0)
+        index, unknown = self.index, []
+        for k, v in row.items():
+            j = index.get(k)
+            if j is None:
+                unknown.append(k)
+            else:
+                out[j] = np.nan if v is None else v
+        return unknown
+
+    def _run(self, X: np.ndarray) -> np.ndarray:
+        if self._booster is not None:
+            return self._booster.inplace_predict(X, iteration_range=self._iteration_range)
+        with warnings.catch_warnings():
+            # sklearn models fitted on DataFrames warn on every ndarray call
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return self.model.predict(X)
+
+    def _predict_frame(self, rows: List[Dict[str, Any]]) -> np.ndarray:
+        # bundles without feature_names: let pandas infer the columns
+        import pandas as pd
+        return self.model.predict(pd.DataFrame(rows))
+
+    def predict_row(self, row: Dict[str, Any], timings: Optional[Dict[str, float]] = None) -> Tuple[float, List[str]]:
+        t0 = perf_counter()
+        if not self.features:
+            y, unknown = float(self._predict_frame([row])[0]), []
+            t1 = t0
+        else:
+            buf = self._row_buffer()
+            unknown = self._fill(row, buf[0])
+            t1 = perf_counter()
+            y = float(self._run(buf)[0])
+        if timings is not None:
+            _add(timings, "features", t1 - t0)
+            _add(timings, "model", perf_counter() - t1)
+        return y, unknown
+
+    def predict(self, row: Dict[str, Any]) -> float:
+        return self.predict_row(row)[0]
+
+    def predict_batch(self, rows: List[Any], timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        t0 = perf_counter()
+        results: List[Dict[str, Any]] = [{} for _ in rows]
+        # one contiguous matrix for the whole batch; bad rows are skipped, not fatal
+        X = np.zeros((len(rows), len(self.features)), dtype=np.float32)
+        ok: List[int] = []
+        unknowns: List[List[str]] = []
+        for i, row in enumerate(rows):
+            r = len(ok)
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError("expected a flat feature dict")
+                unknown = self._fill(row, X[r]) if self.features else []
+            except (TypeError, ValueError) as e:
+                results[i] = {"error": str(e)}
+                continue
+            ok.append(i)
+            unknowns.append(unknown)
+        if not ok:
+            return results
+        t1 = perf_counter()
+        if self.features:
+            preds = self._run(X[:len(ok)])
+        else:
+            preds = self._predict_frame([rows[i] for i in ok])
+        if timings is not None:
+            _add(timings, "features", t1 - t0)
+            _add(timings, "model", perf_counter() - t1)
+        for i, y, unknown in zip(ok, preds, unknowns):
+            results[i] = {"power_forecast": float(y)}
+            if unknown:
+                results[i]["unknown_features"] = unknown
+        return results
+
+
+class LSTMPredictor:
+    kind = "sequence"
+
+    def __init__(self, model_path: pathlib.Path, cfg: Optional[dict] = None):
+        # checkpoints from scripts/train_lstm.py; sizes missing from older ones come from params.yaml lstm
+        import torch
+        ckpt = torch.load(model_path, map_location="cpu")
+        from scripts.train_lstm import LSTMReg
+        cfg = cfg or {}
+        self.seq_len = ckpt.get("seq_len", cfg.get("seq_len"))
+        self.model = LSTMReg(
+            input_size=int(ckpt.get("input_size", 1)),
+            hidden_size=int(ckpt.get("hidden_size", cfg.get("hidden_size", 64))),
+            num_layers=int(ckpt.get("num_layers", cfg.get("num_layers", 2))),
+        )
+        self.model.load_state_dict(ckpt["model_state"])
+        self.model.eval()
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        import torch
+        with torch.no_grad():
+            return self.model(torch.from_numpy(x)).cpu().numpy().reshape(-1)
+    def predict(self, window_2d: List[List[float]]) -> float:
+        return float(self._forward(np.asarray([window_2d], dtype=np.float32))[0])
+    def predict_batch(self, windows: List[Any], timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        t0 = perf_counter()
+        results: List[Dict[str, Any]] = [{} for _ in windows]
+        by_shape: Dict[tuple, List[int]] = {}
+        arrays = {}
+        for i, w in enumerate(windows):
+            try:
+                a = np.asarray(w, dtype=np.float32)
+                if a.ndim != 2 or a.shape[0] == 0:
+                    raise ValueError("expected a non-empty [timesteps][features] window")
+            except (TypeError, ValueError) as e:
+                results[i] = {"error": str(e)}
+                continue
+            arrays[i] = a
+            by_shape.setdefault(a.shape, []).append(i)
+        # one forward pass per distinct window shape (normally exactly one)
+        for idx in by_shape.values():
+            x = np.stack([arrays[i] for i in idx])
+            t1 = perf_counter()
+            try:
+                y = self._forward(x)
+            except Exception as e:
+                for i in idx:
+                    results[i] = {"error": str(e)}
+                continue
+            finally:
+                if timings is not None:
+                    t2 = perf_counter()
+                    _add(timings, "features", t1 - t0)
+                    _add(timings, "model", t2 - t1)
+                    t0 = t2
+            for i, v in zip(idx, y):
+                results[i] = {"power_forecast": float(v)}
+        return results
+
+
+class ArimaObservations:
+    """Values appended to the per-link ARIMA models, kept outside the model registry.
+
+    A forecaster that the registry evicts, or drops on a refresh, is reloaded
+    from its artefact and replays these values with `extend`, so appended
+    state survives the LRU. Values are tied to the artefact they were appended
+    to (path and mtime): a retrained artefact starts from its own fit.
+    """
+    def __init__(self):
+        self._values: Dict[str, Tuple[int, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def append(self, path: pathlib.Path, mtime: int, y: np.ndarray) -> None:
+        with self._lock:
+            held = self._values.get(str(path))
+            if held is None or held[0] != mtime:
+                held = self._values[str(path)] = (mtime, [])
+            held[1].extend(y.tolist())
+
+    def since(self, path: pathlib.Path, mtime: int, start: int) -> np.ndarray:
+        """Values appended to this artefact from position `start` on."""
+        with self._lock:
+            held = self._values.get(str(path))
+            if held is None or held[0] != mtime:
+                return np.empty(0)
+            return np.asarray(held[1][start:], dtype=np.float64)
+
+
+class ArimaForecaster:
+    """Fitted statsmodels ARIMA results saved by scripts/train_arima.py.
+
+    New observations are appended with `results.extend`, which runs the
+    Kalman filter over the new points only and keeps the fitted
+    parameters. They are recorded in `observations` first and the results
+    catch up from there, so a reloaded forecaster continues where the
+    evicted one stopped. The last multi-step forecast is kept until the
+    next append; shorter horizons are prefixes of it.
+    """
+    kind = "forecast"
+
+    def __init__(self, model_path: pathlib.Path, observations: Optional[ArimaObservations] = None):
+        from statsmodels.tsa.arima.model import ARIMAResults
+        self.path, self.mtime = model_path, model_path.stat().st_mtime_ns
+        self.results = ARIMAResults.load(model_path)
+        self.observations = observations if observations is not None else ArimaObservations()
+        self.appended = 0
+        self._forecast = np.empty(0)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._catch_up()
+    def _catch_up(self) -> None:
+        y = self.observations.since(self.path, self.mtime, self.appended)
+        if len(y):
+            self.results = self.results.extend(y)
+            self.appended += len(y)
+            self._forecast = np.empty(0)
+    def forecast(self, steps: int) -> List[float]:
+        with self._lock:
+            self._catch_up()
+            if steps > len(self._forecast):
+                self._forecast = np.asarray(self.results.forecast(steps=steps), dtype=np.float64)
+            return self._forecast[:steps].tolist()
+    def observe(self, values: List[float]) -> int:
+        y = np.asarray(values, dtype=np.float64).reshape(-1)
+        with self._lock:
+            self.observations.append(self.path, self.mtime, y)
+            self._catch_up()
+            return self.appended
+
+
+# --- onnxruntime backends (models exported by scripts/export_onnx.py) ---
+def _onnx_session(model_path: pathlib.Path):
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(str(model_path), sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+class OnnxTabularPredictor(SklearnPredictor):
+    """Exported XGBoost model; same compiled feature layout, onnxruntime instead of the booster."""
+    def __init__(self, session):
+        self.model, self._booster, self.session = None, None, session
+        meta = session.get_modelmeta().custom_metadata_map
+        features = json.loads(meta.get("feature_names", "[]"))
+        if not features:
+            raise RuntimeError("ONNX tabular model has no feature_names metadata; re-export it")
+        self._compile_layout(features)
+        self._input = session.get_inputs()[0].name
+    def _run(self, X: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self._input: X})[0].reshape(-1)
+
+
+class OnnxSequencePredictor(LSTMPredictor):
+    """Exported LSTM; windows are [batch, timesteps, features] float32."""
+    def __init__(self, session):
+        self.session = session
+        self._input = session.get_inputs()[0].name
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self._input: x})[0].reshape(-1)
+
+
+def load_onnx_predictor(model_path: pathlib.Path):
+    session = _onnx_session(model_path)
+    kind = session.get_modelmeta().custom_metadata_map.get("kind", "tabular")
+    if kind == "sequence":
+        return OnnxSequencePredictor(session)
+    return OnnxTabularPredictor(session)
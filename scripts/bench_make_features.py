@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Benchmark: add_lags_and_rollups (one group layout, lags gathered from one
+array per target) vs the previous per-lag groupby().shift() implementation,
+the vectorized assign_splits vs the previous per-group loop, and the as-of
+KPI join (tolerance 0) vs the previous exact-timestamp merge.
+
+python scripts/bench_make_features.py --links 200 --days 730 --freq 1h
+python scripts/bench_make_features.py --links 2000 --days 7      # many short links (split loop)
+
+The synthetic gold table has one row per link and window (with ~10% of
+windows missing and some NaN targets). Exits non-zero if the two
+implementations disagree on any value, or if the full, incremental,
+streaming and parallel make_features builds of a small date-partitioned
+gold table differ.
+"""
+from __future__ import annotations
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import make_features as mf  # noqa: E402
+from make_features import TARGETS, add_lags_and_rollups, assign_splits, maybe_join_kpis, rolling_mean_std  # noqa: E402
+
+
+def legacy_add_lags_and_rollups(
+    df: pd.DataFrame, group_cols: List[str], targets: List[str], max_lag: int, rolling: int
+) -> pd.DataFrame:
+    # add_lags_and_rollups before the vectorized engine: one groupby pass per target and lag
+    df = df.copy()
+    df.sort_values(["window_start_ts"], kind="stable", inplace=True)
+    for t in targets:
+        shifted = {lag: df.groupby(group_cols)[t].shift(lag) for lag in range(0, max(max_lag, rolling - 1) + 1)}
+        # null-key rows belong to no group: NaN at every shift (pandas returns NaN for them at
+        # shift(0) in some versions and the value itself in others)
+        shifted[0] = shifted[0].where(df[group_cols].notna().all(axis=1))
+        for lag in range(1, max_lag + 1):
+            df[f"{t}_lag_{lag}"] = shifted[lag]
+        if rolling > 0:
+            win = np.column_stack([shifted[lag].to_numpy(dtype=np.float64) for lag in range(rolling - 1, -1, -1)])
+            df[f"{t}_roll_mean"], df[f"{t}_roll_std"] = rolling_mean_std(win)
+    return df
+
+
+def legacy_assign_splits(df: pd.DataFrame, group_cols: List[str], fracs: dict) -> pd.DataFrame:
+    # assign_splits before vectorization: three .loc assignments per group
+    df = df.copy()
+    df["split"] = "test"
+    for _, grp in df.groupby(group_cols, sort=False):
+        n = len(grp)
+        if n == 0:
+            continue
+        train_end = max(1, int(n * fracs["train"]))
+        val_end = max(train_end, int(n * (fracs["train"] + fracs["val"])))
+        if val_end >= n:
+            val_end = n - 1 if n > 1 else n
+        idx = grp.index.to_list()
+        df.loc[idx[:train_end], "split"] = "train"
+        df.loc[idx[train_end:val_end], "split"] = "val"
+        df.loc[idx[val_end:], "split"] = "test"
+    return df
+
+
+def legacy_join_kpis(df: pd.DataFrame, kpi_path: Path) -> pd.DataFrame:
+    # maybe_join_kpis before the as-of join: hash merge on exact (node, timestamp)
+    kpi = pd.read_parquet(kpi_path)
+    df = df.merge(kpi, left_on=["src_node", "window_start_ts"], right_on=["node", "window_start_ts"],
+                  how="left", suffixes=("", "_kpi"))
+    return df.drop(columns=["node"])
+
+
+def synthetic_kpis(df: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    # one row per node and window, ~10% missing, in no particular order
+    rng = np.random.default_rng(seed)
+    ts = np.sort(df["window_start_ts"].unique())
+    nodes = df["src_node"].dropna().unique()
+    n = len(ts) * len(nodes)
+    kpi = pd.DataFrame({"node": np.repeat(nodes, len(ts)), "window_start_ts": np.tile(ts, len(nodes)),
+                        "cpu_util": rng.random(n), "mem_util": rng.random(n)})
+    return kpi[rng.random(n) > 0.1].sample(frac=1.0, random_state=seed)
+
+
+def synthetic_gold(links: int, days: int, freq: str, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range("2023-01-01", periods=int(pd.Timedelta(days=days) / pd.Timedelta(freq)), freq=freq)
+    n = links * len(ts)
+    df = pd.DataFrame({
+        "src_node": np.repeat([f"node-{i % 40}" for i in range(links)], len(ts)),
+        "dst_node": np.repeat([f"node-{i}" for i in range(links)], len(ts)),
+        "window_start_ts": np.tile(ts.values, links),
+        "sum_energy_Wh": rng.gamma(2.0, 20.0, n),
+        "sum_duration_s": rng.gamma(2.0, 5.0, n),
+    })
+    df.loc[rng.random(n) < 0.02, "sum_energy_Wh"] = np.nan
+    # a few rows with a missing link key, which groupby drops
+    df.loc[rng.random(n) < 0.001, "src_node"] = None
+    df.loc[rng.random(n) < 0.001, "dst_node"] = None
+    df = df[rng.random(n) > 0.1]
+    return df.sort_values(["src_node", "dst_node", "window_start_ts"]).reset_index(drop=True)
+
+
+def write_partitioned_gold(root: Path, df: pd.DataFrame, tz: str, freq: str) -> List[str]:
+    """`df` as a gold table with one date= partition per local date in `tz` (as the gold job
+    derives `date` in the Spark session time zone); returns the partition names in order."""
+    df = df.assign(window_end_ts=df["window_start_ts"] + pd.Timedelta(freq))
+    date = df["window_start_ts"].dt.tz_localize("UTC").dt.tz_convert(tz).dt.strftime("%Y-%m-%d")
+    names = []
+    for day, part in df.groupby(date, sort=True):
+        out = root / f"date={day}" / "part-0.parquet"
+        out.parent.mkdir(parents=True)
+        part.to_parquet(out, index=False)
+        names.append(out.parent.name)
+    return names
+
+
+def check_build_modes(tmp: Path, date_from: str, date_to: str, tz: str = "Europe/Amsterdam") -> bool:
+    """features.parquet of the full, incremental (two increments), streaming and parallel
+    builds over a date range of a gold table partitioned in a non-UTC time zone."""
+    freq = "1h"
+    gold = synthetic_gold(links=20, days=6, freq=freq)
+    staged = tmp / "gold_all"
+    names = write_partitioned_gold(staged, gold, tz, freq)
+    gold_path = tmp / "gold"
+    params = {
+        "data": {"gold_path": str(gold_path), "columns": None, "date_from": date_from, "date_to": date_to},
+        "features": {"max_lag": 3, "rolling": 4, "kpi_path": None, "memory_budget_mb": 0.5,
+                     "dataset_path": str(tmp / "by_date")},
+        "split": {"mode": "per_link", "train_frac": 0.7, "val_frac": 0.1, "test_frac": 0.2},
+    }
+
+    def run(name: str, build: Callable[[dict], None]) -> pa.Table:
+        p = {**params, "data": {**params["data"], "features_path": str(tmp / f"{name}.parquet")}}
+        build(p)
+        return pq.read_table(p["data"]["features_path"])
+
+    def stage(upto: int) -> None:
+        for name in names[:upto]:
+            if not (gold_path / name).exists():
+                shutil.copytree(staged / name, gold_path / name)
+
+    stage(len(names) // 2)
+    run("incremental", mf.build_features_incremental)
+    stage(len(names))
+    outputs = {
+        "incremental": run("incremental", mf.build_features_incremental),
+        "full": run("full", mf.build_features),
+        "stream": run("stream", mf.build_features_streaming),
+        "parallel": run("parallel", lambda p: mf.build_features_parallel(p, 2)),
+    }
+    selected = sum(len(pd.read_parquet(gold_path / n)) for n in names
+                   if date_from <= n.split("=", 1)[1] <= date_to)
+    print(f"build modes, date={date_from}..{date_to} ({tz} partitions holding {selected:,} rows): "
+          + ", ".join(f"{k} {t.num_rows:,}" for k, t in outputs.items()))
+    ok = outputs["full"].num_rows == selected
+    if not ok:
+        print("parity build mode full FAIL: does not keep every row of the selected partitions")
+    for name, table in outputs.items():
+        if name != "full" and not table.equals(outputs["full"]):
+            print(f"parity build mode {name} FAIL: differs from the full build")
+            ok = False
+    if ok:
+        print("parity build modes ok (incremental, stream, parallel == full)")
+    return ok
+
+
+def timed(fn: Callable[[], pd.DataFrame], repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--links", type=int, default=200)
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--freq", default="1h", help="Gold window length, e.g. 5min or 1h.")
+    ap.add_argument("--max-lag", type=int, default=12)
+    ap.add_argument("--rolling", type=int, default=12)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    df = synthetic_gold(args.links, args.days, args.freq)
+    print(f"gold rows={len(df):,} links={args.links} days={args.days} freq={args.freq}")
+    kw = dict(group_cols=["src_node", "dst_node"], targets=TARGETS, max_lag=args.max_lag, rolling=args.rolling)
+
+    t_old, old = timed(lambda: legacy_add_lags_and_rollups(df, **kw), args.repeat)
+    t_new, new = timed(lambda: add_lags_and_rollups(df, **kw), args.repeat)
+    print(f"legacy groupby.shift  {t_old:8.2f} s")
+    print(f"vectorized lags       {t_new:8.2f} s   speedup x{t_old / t_new:.1f}")
+
+    fracs = {"train": 0.7, "val": 0.1, "test": 0.2}
+    t_old_split, old_split = timed(lambda: legacy_assign_splits(new, ["src_node", "dst_node"], fracs), args.repeat)
+    t_new_split, new_split = timed(lambda: assign_splits(new, ["src_node", "dst_node"], fracs), args.repeat)
+    print(f"legacy split loop     {t_old_split:8.2f} s")
+    print(f"vectorized split      {t_new_split:8.2f} s   speedup x{t_old_split / t_new_split:.1f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kpi_path = Path(tmp) / "kpis.parquet"
+        synthetic_kpis(new).to_parquet(kpi_path, index=False)
+        t_old_kpi, old_kpi = timed(lambda: legacy_join_kpis(new, kpi_path), args.repeat)
+        t_new_kpi, new_kpi = timed(lambda: maybe_join_kpis(new, kpi_path), args.repeat)
+    print(f"legacy KPI merge      {t_old_kpi:8.2f} s")
+    print(f"as-of KPI join        {t_new_kpi:8.2f} s")
+
+    ok = True
+    for name, a, b in [("lags/rolling", old, new), ("splits", old_split, new_split),
+                       ("kpi join", old_kpi, new_kpi)]:
+        try:
+            pd.testing.assert_frame_equal(a, b, check_exact=True)
+            print(f"parity {name} ok (bit-identical)")
+        except AssertionError as e:
+            print(f"parity {name} FAIL: {e}")
+            ok = False
+    with tempfile.TemporaryDirectory() as tmp:
+        ok &= check_build_modes(Path(tmp), "2023-01-02", "2023-01-04")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Parity check + latency benchmark: onnxruntime backend vs native XGBoost/torch predictors.
+
+python scripts/bench_onnx.py                     # synthetic models
+python scripts/bench_onnx.py --xgb models/xgb/sum_energy_Wh.json \
+    --lstm models/lstm/sum_energy_Wh/n1_n2.pt    # trained artefacts
+
+Exits non-zero when the ONNX outputs drift from the native ones by more
+than --atol/--rtol, so it can gate the export_onnx stage in CI.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from export_onnx import export_lstm_model, export_xgb_model  # noqa: E402
+from ingest.predictors import LSTMPredictor, SklearnPredictor, load_onnx_predictor  # noqa: E402
+
+
+def synthetic_xgb(tmp: Path, n_features: int) -> Path:
+    import xgboost as xgb
+    from train_xgb import build_features, link_vocab
+
+    # built the way train_xgb.py builds its models, link dummies included
+    rng = np.random.default_rng(0)
+    cols = [f"sum_energy_Wh_lag_{i}" for i in range(1, n_features + 1)]
+    df = pd.DataFrame(rng.gamma(2.0, 20.0, size=(4000, n_features)), columns=cols)
+    df["src_node"] = rng.choice([f"n{i}" for i in range(4)], size=len(df))
+    df["dst_node"] = rng.choice([f"m{i}" for i in range(4)], size=len(df))
+    df["sum_energy_Wh"] = df.iloc[:, :6].mean(axis=1) + 5.0 * (df["src_node"] == "n1") + rng.normal(scale=0.5, size=len(df))
+    X, y = build_features(df, "sum_energy_Wh", vocab=link_vocab(df))
+    booster = xgb.train({"max_depth": 6, "learning_rate": 0.05}, xgb.QuantileDMatrix(X, y), num_boost_round=400)
+    path = tmp / "xgb.json"
+    booster.save_model(path)
+    return path
+
+
+def synthetic_lstm(tmp: Path, cfg: dict) -> Path:
+    import torch
+    from train_lstm import LSTMReg
+
+    torch.manual_seed(0)
+    model = LSTMReg(input_size=1, hidden_size=int(cfg["hidden_size"]), num_layers=int(cfg["num_layers"]))
+    path = tmp / "lstm.pt"
+    torch.save({"model_state": model.state_dict(), "seq_len": int(cfg["seq_len"]), "input_size": 1,
+                "hidden_size": int(cfg["hidden_size"]), "num_layers": int(cfg["num_layers"])}, path)
+    return path
+
+
+def native_xgb(model_path: Path) -> SklearnPredictor:
+    import xgboost as xgb
+
+    model = xgb.XGBRegressor()
+    model.load_model(model_path)
+    return SklearnPredictor({"model": model, "feature_names": model.get_booster().feature_names})
+
+
+def latency_us(fn: Callable[[], object], iters: int) -> np.ndarray:
+    for _ in range(min(50, iters)):
+        fn()
+    lat = np.empty(iters)
+    for i in range(iters):
+        t0 = time.perf_counter()
+        fn()
+        lat[i] = time.perf_counter() - t0
+    return lat * 1e6
+
+
+def check(name: str, a: np.ndarray, b: np.ndarray, rtol: float, atol: float) -> bool:
+    err = float(np.max(np.abs(a - b))) if len(a) else 0.0
+    ok = bool(np.allclose(a, b, rtol=rtol, atol=atol))
+    print(f"parity {name:<5} max_abs_err={err:.3e} {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def report(rows: Dict[str, np.ndarray]) -> None:
+    print(f"{'case':<26} {'mean_us':>9} {'p50_us':>9} {'p99_us':>9}")
+    for name, lat in rows.items():
+        print(f"{name:<26} {lat.mean():9.1f} {np.percentile(lat, 50):9.1f} {np.percentile(lat, 99):9.1f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--params", default="params.yaml")
+    ap.add_argument("--xgb", type=Path, help="Trained models/xgb/<target>.json (default: synthetic).")
+    ap.add_argument("--lstm", type=Path, help="Trained models/lstm/<target>/<src>_<dst>.pt (default: synthetic).")
+    ap.add_argument("--n-features", type=int, default=60)
+    ap.add_argument("--batch", type=int, default=256)
+    ap.add_argument("--iters", type=int, default=2000)
+    ap.add_argument("--rtol", type=float, default=1e-4)
+    ap.add_argument("--atol", type=float, default=1e-4)
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(open(args.params))["lstm"]
+    rng = np.random.default_rng(1)
+    ok = True
+    timings: Dict[str, np.ndarray] = {}
+
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        xgb_path = args.xgb or synthetic_xgb(tmp, args.n_features)
+        lstm_path = args.lstm or synthetic_lstm(tmp, cfg)
+        native_tab = native_xgb(xgb_path)
+        onnx_tab = load_onnx_predictor(export_xgb_model(xgb_path, tmp / "xgb.onnx"))
+        native_seq = LSTMPredictor(lstm_path, cfg)
+        onnx_seq = load_onnx_predictor(export_lstm_model(lstm_path, tmp / "lstm.onnx", cfg))
+
+        feats: List[str] = native_tab.features
+        values = rng.gamma(2.0, 20.0, size=(args.batch, len(feats)))
+        # link dummies are 0/1, as the service sends them
+        dummies = [j for j, f in enumerate(feats) if f.startswith(("src_node_", "dst_node_"))]
+        values[:, dummies] = rng.integers(0, 2, size=(args.batch, len(dummies)))
+        rows = [dict(zip(feats, r)) for r in values.tolist()]
+        a = np.array([r["power_forecast"] for r in native_tab.predict_batch(rows)])
+        b = np.array([r["power_forecast"] for r in onnx_tab.predict_batch(rows)])
+        ok &= check("xgb", a, b, args.rtol, args.atol)
+
+        seq_len = int(native_seq.seq_len or cfg["seq_len"])
+        windows = rng.gamma(2.0, 20.0, size=(args.batch, seq_len, 1)).astype(np.float32)
+        a = native_seq._forward(windows)
+        b = onnx_seq._forward(windows)
+        ok &= check("lstm", a, b, args.rtol, args.atol)
+
+        row, window = rows[0], windows[0].tolist()
+        timings["xgb native  row"] = latency_us(lambda: native_tab.predict(row), args.iters)
+        timings["xgb onnx    row"] = latency_us(lambda: onnx_tab.predict(row), args.iters)
+        timings[f"xgb native  batch[{args.batch}]"] = latency_us(lambda: native_tab.predict_batch(rows), args.iters // 10)
+        timings[f"xgb onnx    batch[{args.batch}]"] = latency_us(lambda: onnx_tab.predict_batch(rows), args.iters // 10)
+        timings["lstm native window"] = latency_us(lambda: native_seq.predict(window), args.iters)
+        timings["lstm onnx   window"] = latency_us(lambda: onnx_seq.predict(window), args.iters)
+        timings[f"lstm native batch[{args.batch}]"] = latency_us(lambda: native_seq._forward(windows), args.iters // 10)
+        timings[f"lstm onnx   batch[{args.batch}]"] = latency_us(lambda: onnx_seq._forward(windows), args.iters // 10)
+
+    report(timings)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
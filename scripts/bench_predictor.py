@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: compiled-layout SklearnPredictor vs the old per-call DataFrame path.
+
+python scripts/bench_predictor.py --n-features 120 --iters 5000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ingest.predictors import SklearnPredictor  # noqa: E402
+
+
+def legacy_predict(model, features: List[str], row: Dict[str, float]) -> float:
+    # SklearnPredictor.predict before the compiled layout
+    X = pd.DataFrame([row])
+    for c in features:
+        if c not in X:
+            X[c] = 0.0
+    X = X[features] if features else X
+    return float(model.predict(X)[0])
+
+
+def time_calls(fn: Callable[[Dict[str, float]], float], rows: List[Dict[str, float]], iters: int) -> np.ndarray:
+    for row in rows[:50]:
+        fn(row)
+    lat = np.empty(iters)
+    for i in range(iters):
+        row = rows[i % len(rows)]
+        t0 = time.perf_counter()
+        fn(row)
+        lat[i] = time.perf_counter() - t0
+    return lat * 1e6
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n-features", type=int, default=120)
+    ap.add_argument("--fill-frac", type=float, default=0.7, help="Fraction of features sent per request.")
+    ap.add_argument("--iters", type=int, default=5000)
+    ap.add_argument("--n-estimators", type=int, default=200)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    features = [f"f{i}" for i in range(args.n_features)]
+    X = pd.DataFrame(rng.normal(size=(2000, args.n_features)), columns=features)
+    y = X.iloc[:, :10].sum(axis=1) + rng.normal(scale=0.1, size=len(X))
+    model = xgb.XGBRegressor(n_estimators=args.n_estimators, max_depth=6).fit(X, y)
+
+    n_sent = max(1, int(args.n_features * args.fill_frac))
+    rows = []
+    for _ in range(256):
+        cols = rng.choice(features, size=n_sent, replace=False)
+        rows.append({c: float(v) for c, v in zip(cols, rng.normal(size=n_sent))})
+
+    predictor = SklearnPredictor({"model": model, "feature_names": features})
+    for row in rows[:20]:
+        a, b = legacy_predict(model, features, row), predictor.predict(row)
+        if not np.isclose(a, b, rtol=1e-6, atol=1e-6):
+            print(f"parity mismatch: legacy={a} compiled={b}")
+            return 1
+
+    results = {
+        "legacy_dataframe": time_calls(lambda r: legacy_predict(model, features, r), rows, args.iters),
+        "compiled_layout": time_calls(predictor.predict, rows, args.iters),
+    }
+    print(f"{'path':<18} {'mean_us':>9} {'p50_us':>9} {'p99_us':>9}")
+    for name, lat in results.items():
+        print(f"{name:<18} {lat.mean():9.1f} {np.percentile(lat, 50):9.1f} {np.percentile(lat, 99):9.1f}")
+    speedup = results["legacy_dataframe"].mean() / results["compiled_layout"].mean()
+    print(f"speedup: {speedup:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
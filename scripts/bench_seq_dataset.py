@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SeqDataset (one float32 tensor, unfold windows, batches gathered by
+index) vs the previous list of per-timestep (ndarray copy, float) samples fed
+through the default DataLoader collation.
+
+python scripts/bench_seq_dataset.py --length 200000 --seq-len 48 --batch-size 64
+
+Each implementation runs in its own process so peak RSS is its own. Reports
+dataset build time, samples/sec over one shuffled epoch, and peak RSS (also
+as growth over the process after imports); exits
+non-zero if the two produce different batches.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from train_lstm import SeqDataset, batch_loader  # noqa: E402
+
+
+class LegacySeqDataset(Dataset):
+    # SeqDataset before the tensor-backed rewrite
+    def __init__(self, series: np.ndarray, seq_len: int):
+        self.seq_len = seq_len
+        self.series = series
+        self.samples = self._build_samples()
+
+    def _build_samples(self) -> List[Tuple[np.ndarray, float]]:
+        samples = []
+        for i in range(len(self.series) - self.seq_len):
+            x = self.series[i : i + self.seq_len]
+            y = self.series[i + self.seq_len]
+            samples.append((x.astype(np.float32), float(y)))
+        return samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        x, y = self.samples[idx]
+        return torch.tensor(x).unsqueeze(-1), torch.tensor(y)
+
+
+def make(impl: str, series: np.ndarray, seq_len: int, batch_size: int, shuffle: bool):
+    if impl == "legacy":
+        ds = LegacySeqDataset(series, seq_len)
+        return ds, DataLoader(ds, batch_size=batch_size, shuffle=shuffle)
+    ds = SeqDataset(series, seq_len)
+    return ds, batch_loader(ds, batch_size, shuffle=shuffle)
+
+
+def synthetic_series(length: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.gamma(2.0, 20.0, length)
+
+
+def run(impl: str, args) -> dict:
+    series = synthetic_series(args.length)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # after the torch import
+    t0 = time.perf_counter()
+    ds, loader = make(impl, series, args.seq_len, args.batch_size, shuffle=True)
+    build = time.perf_counter() - t0
+    torch.manual_seed(0)
+    n, t0 = 0, time.perf_counter()
+    for xb, yb in loader:
+        n += len(yb)
+    epoch = time.perf_counter() - t0
+    return {"build_s": build, "samples_per_s": n / epoch, "samples": n,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "base_rss_mb": base}
+
+
+def parity(args) -> bool:
+    series = synthetic_series(min(args.length, 20000))
+    for shuffle in (False, True):
+        batches = []
+        for impl in ("legacy", "new"):
+            torch.manual_seed(1)
+            _, loader = make(impl, series, args.seq_len, args.batch_size, shuffle)
+            batches.append(list(loader))
+        if len(batches[0]) != len(batches[1]) or not all(
+            torch.equal(a[0], b[0]) and torch.equal(a[1], b[1]) for a, b in zip(*batches)
+        ):
+            return False
+    return True
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--length", type=int, default=200_000, help="Timesteps in the series.")
+    ap.add_argument("--seq-len", type=int, default=48)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--impl", choices=["legacy", "new"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.impl:
+        print(json.dumps(run(args.impl, args)))
+        return 0
+
+    print(f"series length={args.length:,} seq_len={args.seq_len} batch_size={args.batch_size}")
+    results = {}
+    for impl in ("legacy", "new"):
+        out = subprocess.run([sys.executable, __file__, "--impl", impl, "--length", str(args.length),
+                              "--seq-len", str(args.seq_len), "--batch-size", str(args.batch_size)],
+                             check=True, capture_output=True, text=True).stdout
+        results[impl] = r = json.loads(out.strip().splitlines()[-1])
+        print(f"{impl:6s}  build {r['build_s']:7.2f} s   {r['samples_per_s']:12,.0f} samples/s   peak RSS {r['peak_rss_mb']:7.0f} MB "
+              f"(+{r['peak_rss_mb'] - r['base_rss_mb']:.0f} MB over the process after imports)")
+    print(f"speedup x{results['new']['samples_per_s'] / results['legacy']['samples_per_s']:.1f} samples/s")
+
+    ok = parity(args)
+    print("parity batches " + ("ok (identical)" if ok else "FAIL"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
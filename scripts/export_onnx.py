@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Export trained models to ONNX for the onnxruntime backend of the inference service.
+
+  models/xgb/<target>.json             -> models/onnx/xgb/<target>.onnx
+  models/lstm/<target>/<src>_<dst>.pt  -> models/onnx/lstm/<target>/<src>_<dst>.onnx
+
+The feature layout (tabular) and the model kind are stored in the ONNX
+metadata, so a champion.json of {"model_type": "onnx", "model_path": ...}
+is all the service needs.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import onnx
+import yaml
+
+OPSET = 17
+
+
+def read_params(path: Path) -> dict:
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def _set_metadata(model: onnx.ModelProto, props: Dict[str, str]) -> None:
+    onnx.helper.set_model_props(model, {k: str(v) for k, v in props.items()})
+
+
+def export_xgb_model(model_path: Path, out_path: Path, feature_names: Optional[List[str]] = None, opset: int = OPSET) -> Path:
+    import onnxmltools
+    import xgboost as xgb
+    from onnxmltools.convert.common.data_types import FloatTensorType
+
+    booster = xgb.Booster()
+    booster.load_model(model_path)
+    names = list(feature_names or booster.feature_names or [])
+    if not names:
+        raise ValueError(f"{model_path}: no feature names in the model; pass them explicitly")
+    # the converter only understands f0..fN split names; the layout goes into the metadata instead
+    booster.feature_names = None
+    # and only numeric splits: without feature types, indicator ("i") splits of models trained on
+    # bool columns are dumped as x < 1, which is the same split for 0/1 inputs
+    booster.feature_types = None
+    model = onnxmltools.convert_xgboost(
+        booster, initial_types=[("input", FloatTensorType([None, len(names)]))], target_opset=min(opset, 15)
+    )
+    _set_metadata(model, {"kind": "tabular", "feature_names": json.dumps(names), "source": str(model_path)})
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save_model(model, out_path)
+    return out_path
+
+
+def export_lstm_model(ckpt_path: Path, out_path: Path, cfg: dict, opset: int = OPSET) -> Path:
+    import torch
+    from train_lstm import LSTMReg
+
+    ckpt = torch.load(ckpt_path, map_location="cpu")
+    input_size = int(ckpt.get("input_size", 1))
+    seq_len = int(ckpt.get("seq_len", cfg["seq_len"]))
+    model = LSTMReg(
+        input_size=input_size,
+        hidden_size=int(ckpt.get("hidden_size", cfg["hidden_size"])),
+        num_layers=int(ckpt.get("num_layers", cfg["num_layers"])),
+    )
+    model.load_state_dict(ckpt["model_state"])
+    model.eval()
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.onnx.export(
+        model,
+        (torch.zeros(1, seq_len, input_size),),
+        str(out_path),
+        input_names=["window"],
+        output_names=["forecast"],
+        dynamic_axes={"window": {0: "batch"}, "forecast": {0: "batch"}},
+        opset_version=opset,
+        dynamo=False,
+    )
+    onx = onnx.load(out_path)
+    _set_metadata(onx, {"kind": "sequence", "seq_len": seq_len, "input_size": input_size, "source": str(ckpt_path)})
+    onnx.save_model(onx, out_path)
+    return out_path
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--params", default="params.yaml")
+    ap.add_argument("--models-dir", default="models")
+    ap.add_argument("--opset", type=int, default=OPSET)
+    args = ap.parse_args()
+
+    params = read_params(Path(args.params))
+    models_dir = Path(args.models_dir)
+    out_dir = models_dir / "onnx"
+
+    xgb_metrics_path = Path("reports/metrics/xgb.json")
+    xgb_metrics = json.loads(xgb_metrics_path.read_text()) if xgb_metrics_path.exists() else {}
+
+    exported = 0
+    for model_path in sorted((models_dir / "xgb").glob("*.json")):
+        target = model_path.stem
+        names = xgb_metrics.get(target, {}).get("feature_names")
+        export_xgb_model(model_path, out_dir / "xgb" / f"{target}.onnx", names, opset=args.opset)
+        exported += 1
+
+    for ckpt_path in sorted((models_dir / "lstm").glob("*/*.pt")):
+        target = ckpt_path.parent.name
+        export_lstm_model(ckpt_path, out_dir / "lstm" / target / f"{ckpt_path.stem}.onnx", params["lstm"], opset=args.opset)
+        exported += 1
+
+    print(f"exported {exported} models to {out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
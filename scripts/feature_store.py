@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Link-sorted copy of features.parquet, partitioned by split, for the trainers.
+
+    <store_path>/split=train/part-0.parquet   rows sorted by (src_node, dst_node, window_start_ts)
+    <store_path>/split=val/part-0.parquet
+    <store_path>/split=test/part-0.parquet
+    <store_path>/split=<split>/part-0.arrow   same rows, uncompressed Arrow IPC (features.store_ipc)
+    <store_path>/_index.parquet               split, src_node, dst_node, row_start, row_count
+
+make_features.py writes it after every build (features.store_path), in
+bounded memory: link keys are cut into contiguous ranges of about
+features.memory_budget_mb, features.parquet is spilled once into a file per
+split and range, and every range is sorted on its own. A link's rows are
+contiguous and row groups (features.store_row_group_rows, with min/max
+statistics) are small, so `FeatureStore.read_link` reads only the row groups
+holding one link. The trainers read each split once, already in
+(link, time) order, and slice it with the index instead of sorting and
+grouping the whole table. Without a store the helpers fall back to
+features.parquet.
+
+With the Arrow IPC copy, splits are read by memory-mapping it instead of
+decoding Parquet. Float columns are stored with NaN instead of nulls, and each
+key range is one record batch, so the numeric columns of a link's rows become
+NumPy arrays over the mapped file without a copy. The per-link trainers
+(ARIMA, LSTM through `iter_links`) running at the same time on one host then
+share the page cache instead of each holding a decoded copy on the heap.
+`read_split` returns a whole split: it is a view only while the split is a
+single batch, and train_xgb copies it anyway (time sort, dummies, fillna).
+"""
+from __future__ import annotations
+
+import os
+import shutil
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SPLITS = ["train", "val", "test"]
+LINK_COLS = ["src_node", "dst_node"]
+INDEX = "_index.parquet"
+SORT_KEYS = [("src_node", "ascending"), ("dst_node", "ascending"), ("window_start_ts", "ascending")]
+
+
+def _link_ranges(part: pa.Table, split: str, offset: int = 0) -> pa.Table:
+    # rows are link-sorted: a link is one run of equal keys; null keys are not indexed
+    keys = part.select(LINK_COLS).to_pandas()
+    starts = np.flatnonzero(keys.ne(keys.shift()).any(axis=1).to_numpy())
+    counts = np.diff(np.append(starts, len(keys)))
+    first = keys.iloc[starts]
+    ok = first.notna().all(axis=1).to_numpy()
+    return pa.table({
+        "split": pa.array([split] * int(ok.sum()), pa.string()),
+        "src_node": pa.array(first["src_node"].to_numpy(dtype=object)[ok], pa.string()),
+        "dst_node": pa.array(first["dst_node"].to_numpy(dtype=object)[ok], pa.string()),
+        "row_start": pa.array(starts[ok] + offset, pa.int64()),
+        "row_count": pa.array(counts[ok], pa.int64()),
+    })
+
+
+def _ipc_batch(part: pa.Table) -> pa.RecordBatch:
+    # NaN instead of null keeps float columns null-free: to_numpy / to_pandas can then map them without a copy
+    cols = [pc.fill_null(c, np.nan) if pa.types.is_floating(c.type) and c.null_count else c for c in part.columns]
+    table = pa.table(cols, schema=part.schema).combine_chunks()
+    return table.to_batches(max_chunksize=table.num_rows)[0]
+
+
+def _range_rows(features: pq.ParquetFile, memory_budget_mb: float) -> int:
+    # decoded bytes per row, times the ~4 copies of one range alive while it is sorted and written
+    meta = features.metadata
+    size = sum(meta.row_group(i).total_byte_size for i in range(meta.num_row_groups))
+    per_row = max(1.0, size / max(1, meta.num_rows))
+    return max(1000, int(memory_budget_mb * 2**20 / (4 * per_row)))
+
+
+def _key_ranges(features: pq.ParquetFile, range_rows: int, batch_rows: int) -> pd.DataFrame:
+    """src_node, dst_node -> range: every link key (null keys too) in sort order, cut into
+    contiguous ranges of about `range_rows` rows (all splits together; a link is never cut)."""
+    counts = []
+    for batch in features.iter_batches(batch_size=batch_rows, columns=LINK_COLS):
+        counts.append(batch.to_pandas().groupby(LINK_COLS, dropna=False, sort=False).size())
+    if not counts:
+        return pd.DataFrame({"src_node": [], "dst_node": [], "range": np.empty(0, np.int64)})
+    n = pd.concat(counts).groupby(level=[0, 1], dropna=False, sort=False).sum().rename("n").reset_index()
+    # the order of SORT_KEYS: ascending, nulls last
+    n = n.sort_values(LINK_COLS, na_position="last", kind="stable", ignore_index=True)
+    size = n["n"].to_numpy()
+    return n[LINK_COLS].assign(range=(np.cumsum(size) - size) // range_rows)
+
+
+def _spill(features: pq.ParquetFile, ranges: pd.DataFrame, tmp: Path, batch_rows: int) -> Dict[Tuple[str, int], str]:
+    """One pass over features.parquet: every row goes to the file of its split and key range, in file order.
+    The spill files are Arrow IPC streams: written and read back once, they are not worth encoding."""
+    sinks: Dict[Tuple[str, int], pa.OSFile] = {}
+    writers: Dict[Tuple[str, int], pa.ipc.RecordBatchStreamWriter] = {}
+    paths: Dict[Tuple[str, int], str] = {}
+    try:
+        for batch in features.iter_batches(batch_size=batch_rows):
+            keys = batch.select(LINK_COLS + ["split"]).to_pandas()
+            rid = keys[LINK_COLS].merge(ranges, how="left", on=LINK_COLS)["range"].to_numpy()  # null keys match null keys
+            sid = pd.Categorical(keys["split"], categories=SPLITS).codes.astype(np.int64)
+            # one stable gather groups the batch by (split, range); each group is then a zero-copy slice
+            bucket = np.where(sid >= 0, sid * (len(ranges) + 1) + rid, -1)
+            order = np.argsort(bucket, kind="stable")
+            rows = batch.drop_columns(["split"]).take(pa.array(order))
+            bucket = bucket[order]
+            edges = np.flatnonzero(np.diff(bucket)) + 1
+            for start, end in zip(np.append(0, edges), np.append(edges, len(bucket))):
+                if start == end or bucket[start] < 0:
+                    continue
+                key = (SPLITS[sid[order[start]]], int(rid[order[start]]))
+                if key not in writers:
+                    paths[key] = str(tmp / f"{key[0]}-{key[1]:06d}.arrows")
+                    sinks[key] = pa.OSFile(paths[key], "wb")
+                    writers[key] = pa.ipc.new_stream(sinks[key], rows.schema)
+                writers[key].write_batch(rows.slice(start, end - start))
+    finally:
+        for key, w in writers.items():
+            w.close()
+            sinks[key].close()
+    return paths
+
+
+def write_store(features_path: Path, root: Path, row_group_rows: int = 131072, ipc: bool = True,
+                memory_budget_mb: float = 1024) -> int:
+    """Rewrite `root` from features.parquet; returns the number of indexed links.
+
+    Never holds more than one key range of one split: link keys are cut into
+    contiguous ranges of about `memory_budget_mb`, features.parquet is spilled
+    once to a file per split and range, and each split is then written range by
+    range, every range sorted on its own. The output is that of one sort of the
+    whole split.
+    """
+    # buffered reads without pre-buffering: a batch no longer loads whole column chunks of a row group
+    features = pq.ParquetFile(features_path, pre_buffer=False, buffer_size=1 << 20)
+    range_rows = _range_rows(features, memory_budget_mb)
+    batch_rows = min(range_rows, 65536)
+    tmp = root.with_name(root.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    (tmp / "_spill").mkdir(parents=True)
+    ranges = _key_ranges(features, range_rows, batch_rows)
+    spilled = _spill(features, ranges, tmp / "_spill", batch_rows)
+
+    index = []
+    for split in SPLITS:
+        pieces = sorted(r for s, r in spilled if s == split)
+        if not pieces:
+            continue
+        out = tmp / f"split={split}"
+        out.mkdir()
+        schema = features.schema_arrow.remove(features.schema_arrow.get_field_index("split"))
+        # dictionary-encode the string columns only: on float feature columns it costs
+        # several times the write time and makes the file larger
+        strings = [f.name for f in schema if pa.types.is_string(f.type) or pa.types.is_large_string(f.type)]
+        writer = pq.ParquetWriter(out / "part-0.parquet", schema, use_dictionary=strings, write_statistics=True)
+        sink = pa.OSFile(str(out / "part-0.arrow"), "wb") if ipc else None
+        ipc_writer = pa.ipc.new_file(sink, schema) if ipc else None
+        offset = 0
+        try:
+            for r in pieces:
+                with pa.OSFile(spilled[(split, r)], "rb") as source:
+                    part = pa.ipc.open_stream(source).read_all()
+                part = part.take(pc.sort_indices(part, sort_keys=SORT_KEYS))
+                writer.write_table(part, row_group_size=row_group_rows)
+                if ipc_writer is not None:
+                    # one record batch per key range: a link's rows are always inside one batch
+                    ipc_writer.write_batch(_ipc_batch(part))
+                index.append(_link_ranges(part, split, offset))
+                offset += part.num_rows
+        finally:
+            writer.close()
+            if ipc_writer is not None:
+                ipc_writer.close()
+                sink.close()
+    shutil.rmtree(tmp / "_spill")
+    empty = pa.table({c: pa.array([], pa.string()) for c in LINK_COLS})
+    pq.write_table(pa.concat_tables(index) if index else _link_ranges(empty, ""), tmp / INDEX)
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(tmp, root)
+    return sum(t.num_rows for t in index)
+
+
+class FeatureStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.index = pq.read_table(self.root / INDEX).to_pandas()
+        self._mapped: Dict[str, Optional[pa.Table]] = {}
+
+    def path(self, split: str) -> Path:
+        return self.root / f"split={split}" / "part-0.parquet"
+
+    def links(self, split: Optional[str] = None) -> List[Tuple[str, str]]:
+        idx = self.index if split is None else self.index[self.index["split"] == split]
+        return sorted(set(zip(idx["src_node"], idx["dst_node"])))
+
+    def mapped(self, split: str) -> Optional[pa.Table]:
+        """The split's Arrow IPC file, memory-mapped (None without one)."""
+        path = self.path(split).with_suffix(".arrow")
+        if split not in self._mapped:
+            self._mapped[split] = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all() if path.exists() else None
+        return self._mapped[split]
+
+    def read_split(self, split: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """One split in (link, time) order."""
+        table = self.mapped(split)
+        if table is not None:
+            # split_blocks: every numeric column stays its own zero-copy block over the mapping
+            return (table.select(columns) if columns else table).to_pandas(split_blocks=True)
+        if not self.path(split).exists():
+            return pd.DataFrame(columns=columns or [])
+        return pq.read_table(self.path(split), columns=columns).to_pandas()
+
+    def read_link(self, split: str, src: str, dst: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """One link's rows of one split, read from the row groups that hold them."""
+        idx = self.index
+        hit = idx[(idx["split"] == split) & (idx["src_node"] == src) & (idx["dst_node"] == dst)]
+        if hit.empty:
+            return pd.DataFrame(columns=columns or [])
+        start, count = int(hit["row_start"].iloc[0]), int(hit["row_count"].iloc[0])
+        f = pq.ParquetFile(self.path(split))
+        offsets = np.cumsum([0] + [f.metadata.row_group(i).num_rows for i in range(f.num_row_groups)]).tolist()
+        first, last = bisect_right(offsets, start) - 1, bisect_right(offsets, start + count - 1) - 1
+        table = f.read_row_groups(list(range(first, last + 1)), columns=columns)
+        return table.slice(start - offsets[first], count).to_pandas()
+
+    def _pieces(self, split: str, columns: Optional[List[str]]) -> Tuple[List[int], List[pd.DataFrame]]:
+        """First rows and frames of the split's record batches when it is mapped (a link
+        never spans two), else of the whole split."""
+        table = self.mapped(split)
+        if table is None or table.num_rows == 0:
+            return [0], [self.read_split(split, columns)]
+        starts, frames = [], []
+        for batch in (table.select(columns) if columns else table).to_batches():
+            start = starts[-1] + len(frames[-1]) if frames else 0
+            df = batch.to_pandas(split_blocks=True)
+            df.index = pd.RangeIndex(start, start + len(df))  # row numbers of the whole split
+            starts.append(start)
+            frames.append(df)
+        return starts, frames
+
+    def iter_links(self, splits: List[str], columns: Optional[List[str]] = None) -> Iterator[Tuple[str, str, Dict[str, pd.DataFrame]]]:
+        """(src, dst, {split: rows}) per link in key order; each split is read once.
+        With the IPC copy, the numeric columns of every link's rows are views over the mapping."""
+        pieces = {s: self._pieces(s, columns) for s in splits}
+
+        def rows(s: str, start: int, count: int) -> pd.DataFrame:
+            starts, frames = pieces[s]
+            i = bisect_right(starts, start) - 1
+            return frames[i].iloc[start - starts[i]:start - starts[i] + count]
+
+        ranges: Dict[Tuple[str, str], Dict[str, Tuple[int, int]]] = {}
+        idx = self.index[self.index["split"].isin(splits)]
+        for split, src, dst, start, count in zip(idx["split"], idx["src_node"], idx["dst_node"], idx["row_start"], idx["row_count"]):
+            ranges.setdefault((src, dst), {})[split] = (int(start), int(count))
+        for (src, dst) in sorted(ranges):
+            r = ranges[(src, dst)]
+            yield src, dst, {s: rows(s, *r[s]) if s in r else pieces[s][1][0].iloc[0:0] for s in splits}
+
+
+def open_store(params: dict) -> Optional[FeatureStore]:
+    root = params.get("features", {}).get("store_path")
+    return FeatureStore(Path(root)) if root and (Path(root) / INDEX).exists() else None
+
+
+def _read_features(params: dict, columns: Optional[List[str]]) -> pd.DataFrame:
+    if columns is not None:
+        columns = list(dict.fromkeys(LINK_COLS + ["window_start_ts", "split"] + columns))
+    df = pd.read_parquet(Path(params["data"]["features_path"]), columns=columns)
+    df.sort_values(LINK_COLS + ["window_start_ts"], inplace=True)
+    return df
+
+
+def iter_links(params: dict, splits: List[str], columns: Optional[List[str]] = None) -> Iterator[Tuple[str, str, Dict[str, pd.DataFrame]]]:
+    """Per-link rows of the given splits, from the store or else from features.parquet."""
+    store = open_store(params)
+    if store is not None:
+        yield from store.iter_links(splits, columns)
+        return
+    df = _read_features(params, columns)
+    for (src, dst), grp in df.groupby(LINK_COLS):
+        yield src, dst, {s: grp[grp["split"] == s] for s in splits}
+
+
+def read_splits(params: dict, splits: List[str], columns: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Whole splits (link, time order in the store), or else filtered from features.parquet."""
+    store = open_store(params)
+    if store is not None:
+        return {s: store.read_split(s, columns) for s in splits}
+    df = _read_features(params, columns)
+    return {s: df[df["split"] == s] for s in splits}
+
+
+def iter_batches(params: dict, split: str, batch_rows: int = 131072, columns: Optional[List[str]] = None) -> Iterator[pa.RecordBatch]:
+    """One split as record batches of at most `batch_rows`, without reading it whole."""
+    store = open_store(params)
+    if store is not None:
+        if store.path(split).exists():
+            yield from pq.ParquetFile(store.path(split)).iter_batches(batch_size=batch_rows, columns=columns)
+        return
+    dataset = ds.dataset(Path(params["data"]["features_path"]), format="parquet")
+    yield from dataset.to_batches(columns=columns, filter=pc.field("split") == split, batch_size=batch_rows)
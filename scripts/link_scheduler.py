@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Process pool for per-link training jobs (train_arima.py, train_lstm.py per_link).
+
+A job is a dict with "target", "link", an optional "cost" (e.g. row count) and
+whatever the job function needs; the function runs in a worker and returns
+the job's metrics. Jobs are queued largest cost first and handed to whichever
+worker is idle, so long links start early and short ones fill the gaps.
+
+Workers are spawned with OMP/OpenBLAS/MKL thread counts (and torch's) set to
+`threads` each, so `workers` processes use about workers * threads cores
+instead of each BLAS sizing itself to the whole machine. A job running past
+`timeout_s` is interrupted with SIGALRM in its worker (long C calls finish
+first), and a job that raises is recorded, not fatal; so is one that kills its
+worker process, after one retry. Every result carries
+its status and wall time; `job_report` turns them into the "jobs" block of
+the trainer's metrics JSON.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+THREAD_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+               "VECLIB_MAXIMUM_THREADS"]
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def _alarm(signum, frame):
+    raise JobTimeout()
+
+
+def run_job(fn: Callable[[dict], dict], job: dict, timeout_s: Optional[float] = None) -> dict:
+    """Run one job; never raises. Returns target, link, status (ok/failed/timeout), result, error, duration_s."""
+    out = {"target": job["target"], "link": job["link"], "status": "ok", "result": None, "error": None}
+    timed = bool(timeout_s) and hasattr(signal, "setitimer")
+    if timed:
+        previous = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, float(timeout_s))
+    t0 = time.perf_counter()
+    try:
+        out["result"] = fn(job)
+    except JobTimeout:
+        out.update(status="timeout", error=f"exceeded {timeout_s}s")
+    except Exception as e:
+        out.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    out["duration_s"] = round(time.perf_counter() - t0, 4)
+    return out
+
+
+def _init_worker(threads: int) -> None:
+    # the spawned worker has imported the trainer module already; BLAS read the env vars at load
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+        sys.modules["torch"].set_num_interop_threads(1)
+
+
+@contextmanager
+def _thread_env(threads: int):
+    saved = {k: os.environ.get(k) for k in THREAD_VARS}
+    os.environ.update({k: str(threads) for k in THREAD_VARS})
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def run_jobs(fn: Callable[[dict], dict], jobs: List[dict], workers: int = 1, threads: int = 1,
+             timeout_s: Optional[float] = None) -> Iterator[dict]:
+    """Yield run_job results as jobs finish. workers <= 1 runs them in this process, in order."""
+    if workers <= 1:
+        for job in jobs:
+            yield run_job(fn, job, timeout_s)
+        return
+
+    queue = sorted(jobs, key=lambda j: j.get("cost", 0))  # pop() takes the largest
+    retried = set()
+    with _thread_env(threads):
+        while queue:
+            # spawn: workers start with the capped env and without the parent's thread pools
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(threads,))
+            running: Dict = {}
+            try:
+                while queue or running:
+                    # two jobs per worker in flight: the next is pickled while the current one runs
+                    while queue and len(running) < 2 * workers:
+                        job = queue.pop()
+                        running[pool.submit(run_job, fn, job, timeout_s)] = job
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        yield fut.result()
+                        del running[fut]
+            except BrokenProcessPool:
+                # a worker died (OOM kill, segfault) and the pool fails every job in flight: each of
+                # those is queued once more on a fresh pool, and recorded as failed if it dies again
+                for fut, job in running.items():
+                    if fut.done() and fut.exception() is None:
+                        yield fut.result()
+                    elif id(job) not in retried:
+                        retried.add(id(job))
+                        queue.append(job)
+                    else:
+                        yield {"target": job["target"], "link": job["link"], "status": "failed", "result": None,
+                               "error": "worker process died", "duration_s": None}
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+
+def job_report(results: List[dict], workers: int, threads: int, timeout_s: Optional[float], wall_s: float) -> dict:
+    """The "jobs" block of a metrics JSON: counts, wall time and the jobs that did not finish."""
+    durations = [r["duration_s"] for r in results if r["duration_s"] is not None]
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "timeout_s": timeout_s,
+        "wall_s": round(wall_s, 3),
+        "job_s": round(sum(durations), 3),
+        "n_jobs": len(results),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "failed": [{k: r[k] for k in ("target", "link", "error", "duration_s")} for r in results if r["status"] == "failed"],
+        "timeout": [{k: r[k] for k in ("target", "link", "duration_s")} for r in results if r["status"] == "timeout"],
+    }
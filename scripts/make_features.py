@@ -2,143 +2,931 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import yaml
 
+from feature_store import write_store
+
+GROUP_COLS = ["src_node", "dst_node"]
+TARGETS = ["sum_energy_Wh", "sum_duration_s"]
+
 
 def read_params(path: Path) -> dict:
     with open(path, "r") as f:
         return yaml.safe_load(f)
 
 
-def load_gold(path: Path) -> pd.DataFrame:
+# gold columns every build needs, whatever data.columns says
+REQUIRED_COLS = GROUP_COLS + ["window_start_ts", "window_end_ts"] + TARGETS
+
+
+def gold_scan_args(params: dict) -> dict:
+    """load_gold keyword arguments from params.yaml `data` (columns / date_from / date_to)."""
+    data = params.get("data", {})
+    return {"columns": data.get("columns") or None, "date_from": data.get("date_from"), "date_to": data.get("date_to")}
+
+
+def _projection(schema, columns: Optional[List[str]]) -> Optional[List[str]]:
+    if not columns:
+        return None
+    unknown = sorted(set(columns) - set(schema.names))
+    if unknown:
+        raise ValueError(f"data.columns not in gold: {unknown}")
+    wanted = set(columns) | set(REQUIRED_COLS) | {"date"}
+    return [c for c in schema.names if c in wanted]  # keep the gold column order
+
+
+def _scalar(schema, name: str, ts: pd.Timestamp) -> pa.Scalar:
+    """`ts` as a scalar of gold column `name`'s type (string/date partition or timestamp column)."""
+    typ = schema.field(name).type
+    if pa.types.is_string(typ) or pa.types.is_large_string(typ):
+        return pa.scalar(ts.date().isoformat(), type=typ)
+    if pa.types.is_timestamp(typ) and typ.tz is not None and ts.tzinfo is None:
+        ts = ts.tz_localize(typ.tz)
+    return pa.scalar(ts.to_pydatetime() if pa.types.is_timestamp(typ) else ts.date(), type=typ)
+
+
+def _date_filter(schema, date_from, date_to) -> Optional[ds.Expression]:
+    """Inclusive [date_from, date_to] on the `date` partition (prunes directories),
+    or on window_start_ts (prunes row groups through their min/max statistics)
+    when gold has no `date` column.
+
+    Only one of the two defines the range: the gold job derives `date` in the
+    Spark session time zone, so a UTC window_start_ts range would cut rows near
+    midnight off both ends of the selected partitions. Every build mode selects
+    the same rows through this filter or `_in_date_range`.
+    """
+    name = "date" if "date" in schema.names else "window_start_ts"
+    if name not in schema.names:
+        return None
+    expr = None
+    if date_from:
+        expr = ds.field(name) >= _scalar(schema, name, pd.Timestamp(date_from))
+    if date_to:
+        hi = pd.Timestamp(date_to)
+        e = ds.field(name) < _scalar(schema, name, hi + pd.Timedelta(days=1)) if name == "window_start_ts" \
+            else ds.field(name) <= _scalar(schema, name, hi)
+        expr = e if expr is None else expr & e
+    return expr
+
+
+def load_gold(path: Path, columns: Optional[List[str]] = None, date_from=None, date_to=None) -> pd.DataFrame:
     if not path.exists():
         raise FileNotFoundError(f"Gold path not found: {path}")
     fmt = "parquet"
     dataset = ds.dataset(path, format=fmt, partitioning="hive")
-    table = dataset.to_table()
-    df = table.to_pandas()
-    return df
+    expr = _date_filter(dataset.schema, date_from, date_to)
+    table = dataset.to_table(columns=_projection(dataset.schema, columns), filter=expr)
+    # split_blocks keeps null-free numeric columns zero-copy; self_destruct frees
+    # each Arrow column as soon as it has been converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def rolling_mean_std(win: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean and std (ddof=1) of each row of `win` ([n, w], oldest first, NaN = missing).
+
+    Sums are accumulated column by column in a fixed order, so a window gives
+    the same bits however much history preceded it. The online feature state
+    in ingest/online_features.py repeats this arithmetic on its ring buffers.
+    """
+    valid = ~np.isnan(win)
+    cnt = valid.sum(axis=1)
+    total = np.zeros(len(win))
+    for k in range(win.shape[1]):
+        total += np.where(valid[:, k], win[:, k], 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / cnt
+        ssq = np.zeros(len(win))
+        for k in range(win.shape[1]):
+            d = np.where(valid[:, k], win[:, k] - mean, 0.0)
+            ssq += d * d
+        std = np.sqrt(ssq / (cnt - 1))
+    std[cnt < 2] = np.nan
+    return mean, std
+
+
+def group_ranks(keys: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per row: dense group code, position within its group (in the current
+    row order) and group size. Rows with a null key, which groupby would
+    drop, get code and rank -1 and size 0."""
+    n = len(keys)
+    codes = np.zeros(n, dtype=np.int64)
+    valid = np.ones(n, dtype=bool)
+    for c in keys.columns:
+        f, uniques = pd.factorize(keys[c])
+        valid &= f >= 0
+        codes = pd.factorize(codes * (len(uniques) + 1) + f)[0]
+    codes = np.where(valid, codes, -1)
+    rank = pd.Series(codes).groupby(codes).cumcount().to_numpy(dtype=np.int64, copy=True)
+    rank[~valid] = -1
+    size = np.append(np.bincount(codes[valid]), 0)[codes]  # code -1 picks the trailing 0
+    return codes, rank, size
+
+
+def group_layout(keys: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Place every group's rows next to each other, in their current order.
+
+    Returns `slot` (a row's index in that group-contiguous layout) and `rank`
+    (its position within its group, -1 for a null key). No sort is needed:
+    slots come from group sizes.
+    """
+    codes, rank, _ = group_ranks(keys)
+    valid = rank >= 0
+    counts = np.bincount(codes[valid])
+    slot = np.append(np.cumsum(counts) - counts, 0)[codes] + rank  # code -1 (all keys null) picks the trailing 0
+    slot[~valid] = np.arange(valid.sum(), len(keys))
+    return slot, rank
+
+
+def lag_matrix(values: np.ndarray, slot: np.ndarray, rank: np.ndarray, depth: int) -> np.ndarray:
+    """[depth + 1, n] float64 array whose row k is `values` shifted by k within
+    each group (row 0 is `values` itself). A row with a null key belongs to no
+    group: all its rows are NaN, so its lags and rolling stats are NaN too."""
+    contiguous = np.empty(len(values))
+    contiguous[slot] = values
+    out = np.empty((depth + 1, len(values)))
+    out[0] = np.where(rank >= 0, values, np.nan)
+    idx = slot - 1
+    for k in range(1, depth + 1):
+        np.take(contiguous, idx, out=out[k], mode="clip")
+        out[k, rank < k] = np.nan  # also every k for rank -1
+        idx -= 1
+    return out
 
 
 def add_lags_and_rollups(
-    df: pd.DataFrame, group_cols: List[str], targets: List[str], max_lag: int, rolling: int
+    df: pd.DataFrame, group_cols: List[str], targets: List[str], max_lag: int, rolling: int,
+    history: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
-    df = df.copy()
-    df.sort_values(["window_start_ts"], inplace=True)
+    """`history` holds earlier rows (group_cols + targets, oldest first) of the
+    same groups, e.g. the tail state of an incremental build. They feed the
+    lags and windows of the first rows of `df` but are not returned.
+
+    Groups are laid out once (`group_layout`); every lag of a target is then a
+    gather from one contiguous array.
+    """
+    df = df.sort_values(["window_start_ts"], kind="stable")
+    keys = df[group_cols]
+    n_hist = 0
+    if history is not None and len(history):
+        keys = pd.concat([history[group_cols], keys], ignore_index=True)
+        n_hist = len(history)
+    slot, rank = group_layout(keys)
+    depth = max(max_lag, rolling - 1)
+
+    cols = {}
     for t in targets:
+        values = df[t].to_numpy(dtype=np.float64, na_value=np.nan)
+        if n_hist:
+            values = np.concatenate([history[t].to_numpy(dtype=np.float64, na_value=np.nan), values])
+        lags = lag_matrix(values, slot, rank, depth)[:, n_hist:]
         for lag in range(1, max_lag + 1):
-            df[f"{t}_lag_{lag}"] = df.groupby(group_cols)[t].shift(lag)
+            cols[f"{t}_lag_{lag}"] = lags[lag]
         if rolling > 0:
-            df[f"{t}_roll_mean"] = (
-                df.groupby(group_cols)[t].rolling(rolling, min_periods=1).mean().reset_index(level=group_cols, drop=True)
-            )
-            df[f"{t}_roll_std"] = (
-                df.groupby(group_cols)[t].rolling(rolling, min_periods=1).std().reset_index(level=group_cols, drop=True)
-            )
-    return df
+            cols[f"{t}_roll_mean"], cols[f"{t}_roll_std"] = rolling_mean_std(lags[rolling - 1::-1].T)
+    df = df.drop(columns=[c for c in cols if c in df.columns])
+    return pd.concat([df, pd.DataFrame(cols, index=df.index)], axis=1)
+
+
+SPLIT_LABELS = np.array(["train", "val", "test"])
 
 
 def assign_splits(df: pd.DataFrame, group_cols: List[str], fracs: dict) -> pd.DataFrame:
-    df = df.copy()
-    df["split"] = "test"
-    for _, grp in df.groupby(group_cols, sort=False):
-        n = len(grp)
-        if n == 0:
-            continue
-        train_end = max(1, int(n * fracs["train"]))
-        val_end = max(train_end, int(n * (fracs["train"] + fracs["val"])))
-        if val_end >= n:
-            val_end = n - 1 if n > 1 else n
-        idx = grp.index.to_list()
-        df.loc[idx[:train_end], "split"] = "train"
-        df.loc[idx[train_end:val_end], "split"] = "val"
-        df.loc[idx[val_end:], "split"] = "test"
-    return df
-
-
-def maybe_join_kpis(df: pd.DataFrame, kpi_path: Path) -> pd.DataFrame:
+    """Chronological train/val/test split within each group (rows in time order).
+
+    Per group of n rows: the first max(1, int(n * train)) rows are train,
+    then val up to int(n * (train + val)), the rest test; at least the last
+    row is test when n > 1. Rows with a null group key are test.
+    """
+    _, rank, n = group_ranks(df[group_cols])
+    return df.assign(split=SPLIT_LABELS[split_codes(rank, n, fracs)])
+
+
+def split_codes(rank: np.ndarray, n: np.ndarray, fracs: dict) -> np.ndarray:
+    """0/1/2 (train/val/test) for a row at `rank` in a group of `n` rows; rank -1 (null key) is test."""
+    train_end = np.maximum(1, (n * fracs["train"]).astype(np.int64))
+    val_end = np.maximum(train_end, (n * (fracs["train"] + fracs["val"])).astype(np.int64))
+    val_end = np.where(val_end >= n, np.where(n > 1, n - 1, n), val_end)
+    return np.where((rank < 0) | (rank >= val_end), 2, np.where(rank < train_end, 0, 1))
+
+
+def time_cutoffs(ts: pd.Series, split: dict) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """`split.train_end` / `split.val_end` if set, else cut the distinct window timestamps by the fractions."""
+    given = [k for k in ("train_end", "val_end") if split.get(k)]
+    if len(given) == 1:
+        missing = "val_end" if given == ["train_end"] else "train_end"
+        raise ValueError(f"split.{given[0]} is set but split.{missing} is not; set both or neither")
+    if given:
+        tz = ts.dt.tz
+        cut = lambda v: pd.Timestamp(v).tz_localize(tz) if tz is not None and pd.Timestamp(v).tzinfo is None else pd.Timestamp(v)
+        return cut(split["train_end"]), cut(split["val_end"])
+    uniq = np.sort(ts.dropna().unique())
+    if len(uniq) == 0:
+        return pd.Timestamp.max, pd.Timestamp.max
+    train_frac, val_frac = float(split["train_frac"]), float(split["val_frac"])
+    pick = lambda frac: pd.Timestamp(uniq[min(int(len(uniq) * frac), len(uniq) - 1)])
+    return pick(train_frac), pick(train_frac + val_frac)
+
+
+def assign_time_splits(df: pd.DataFrame, ts_col: str, train_end: pd.Timestamp, val_end: pd.Timestamp) -> pd.DataFrame:
+    """Global cutoffs: train before `train_end`, val before `val_end`, test after.
+    No link's val/test window can precede another link's training data."""
+    ts = df[ts_col]
+    code = np.where(ts < train_end, 0, np.where(ts < val_end, 1, 2))
+    return df.assign(split=SPLIT_LABELS[code])
+
+
+# KPI column names tried in order when features.kpi_key / kpi_time are not set
+KPI_KEYS = ["site", "node", "src_node"]
+KPI_TIMES = ["window_start_ts", "timestamp", "ts"]
+KPI_SLICE_ROWS = 1 << 20  # feature rows joined per KPI scan
+
+
+def kpi_args(params: dict) -> dict:
+    """maybe_join_kpis keyword arguments from params.yaml `features`."""
+    f = params.get("features", {})
+    return {
+        "kpi_path": Path(f["kpi_path"]) if f.get("kpi_path") else None,
+        "tolerance": pd.Timedelta(f.get("kpi_tolerance") or 0),
+        "key_col": f.get("kpi_key") or None,
+        "time_col": f.get("kpi_time") or None,
+    }
+
+
+def maybe_join_kpis(
+    df: pd.DataFrame, kpi_path: Optional[Path], tolerance: pd.Timedelta = pd.Timedelta(0),
+    key_col: Optional[str] = None, time_col: Optional[str] = None,
+) -> pd.DataFrame:
+    """As-of join of the KPI table (a file or a partitioned directory) onto `df`.
+
+    Each row gets the last KPI row of its src_node at or before its
+    window_start_ts, at most `tolerance` earlier (0: exact timestamps only).
+    `df` is joined in time slices of KPI_SLICE_ROWS rows; each slice scans
+    only the KPI rows of its nodes and time range, so the KPI table never has
+    to fit in memory. Integer KPI columns come out as float64 (missing = NaN).
+    """
     if not kpi_path or not kpi_path.exists():
         return df
-    kpi = pd.read_parquet(kpi_path)
-    time_col = None
-    for cand in ["window_start_ts", "timestamp", "ts"]:
-        if cand in kpi.columns:
-            time_col = cand
-            break
-    key_col = None
-    for cand in ["site", "node", "src_node"]:
-        if cand in kpi.columns:
-            key_col = cand
-            break
-    if not time_col or not key_col:
+    dataset = ds.dataset(kpi_path, format="parquet", partitioning="hive")
+    names = dataset.schema.names
+    key_col = key_col or next((c for c in KPI_KEYS if c in names), None)
+    time_col = time_col or next((c for c in KPI_TIMES if c in names), None)
+    if key_col not in names or time_col not in names:
         return df
-    kpi[time_col] = pd.to_datetime(kpi[time_col])
-    df = df.merge(
-        kpi,
-        left_on=["src_node", "window_start_ts"],
-        right_on=[key_col, time_col],
-        how="left",
-        suffixes=("", "_kpi"),
-    )
-    df.drop(columns=[c for c in [key_col, time_col] if c in df.columns and c not in ["src_node", "window_start_ts"]], inplace=True, errors="ignore")
-    return df
+    values = [c for c in names if c not in (key_col, time_col)]
+    out_names = [f"{c}_kpi" if c in df.columns else c for c in values]
+    time_typ = dataset.schema.field(time_col).type
 
+    df = df.reset_index(drop=True)
+    ts = df["window_start_ts"].to_numpy()
+    order = np.arange(len(df)) if df["window_start_ts"].is_monotonic_increasing else np.argsort(ts, kind="stable")
+    pos = order[ts[order] == ts[order]]  # NaT rows get no KPIs
+    # match on integer node codes; a null src_node is -1, which no KPI row gets
+    codes, nodes = pd.factorize(df["src_node"])
+    nodes = pd.Index(nodes)
+    cols = {c: np.full(len(df), np.nan) for c in out_names}
+    joined: Dict[str, list] = {c: [] for c in out_names}
+    rows: List[np.ndarray] = []
 
-def build_features(params: dict) -> None:
-    gold_path = Path(params["data"]["gold_path"])
-    features_path = Path(params["data"]["features_path"])
-    features_path.parent.mkdir(parents=True, exist_ok=True)
+    for start in range(0, len(pos), KPI_SLICE_ROWS):
+        idx = pos[start:start + KPI_SLICE_ROWS]
+        left = pd.DataFrame({"ts": ts[idx], "code": codes[idx]})
+        present = np.flatnonzero(np.bincount(left["code"].to_numpy() + 1, minlength=len(nodes) + 1)[1:])
+        expr = ds.field(key_col).isin(pa.array(nodes[present].to_numpy(dtype=object)))
+        if pa.types.is_timestamp(time_typ):
+            lo, hi = pd.Timestamp(ts[idx[0]]) - tolerance, pd.Timestamp(ts[idx[-1]])
+            expr = expr & (ds.field(time_col) >= _scalar(dataset.schema, time_col, lo)) & (
+                ds.field(time_col) <= _scalar(dataset.schema, time_col, hi))
+        kpi = dataset.to_table(columns=[key_col, time_col] + values, filter=expr).to_pandas()
+        kpi[time_col] = pd.to_datetime(kpi[time_col])
+        kpi = kpi[kpi[time_col].notna()]
+        if not kpi[time_col].is_monotonic_increasing:
+            kpi = kpi.sort_values(time_col, kind="stable")
+
+        right = pd.DataFrame({"ts": kpi[time_col].astype(left["ts"].dtype).to_numpy(), "code": nodes.get_indexer(kpi[key_col])})
+        for c, out in zip(values, out_names):
+            right[out] = kpi[c].to_numpy()
+        hit = pd.merge_asof(left, right, on="ts", by="code", tolerance=tolerance,
+                            direction="backward", allow_exact_matches=True)
+        rows.append(idx)
+        for c in out_names:
+            joined[c].append(hit[c].to_numpy())
+
+    if rows:
+        idx = np.concatenate(rows)
+        for c in out_names:
+            v = np.concatenate(joined[c])
+            if v.dtype.kind in "iub":
+                v = v.astype(np.float64)
+            if v.dtype.kind not in "fc":
+                col = np.full(len(df), None, dtype=object)
+                col[idx] = v
+                cols[c] = col
+            else:
+                cols[c][idx] = v
+    return pd.concat([df, pd.DataFrame(cols, index=df.index)], axis=1)
+
+
+def split_fracs(params: dict) -> dict:
+    return {
+        "train": float(params["split"]["train_frac"]),
+        "val": float(params["split"]["val_frac"]),
+        "test": float(params["split"]["test_frac"]),
+    }
 
-    df = load_gold(gold_path)
+
+def apply_splits(df: pd.DataFrame, params: dict) -> pd.DataFrame:
+    split = params["split"]
+    if split.get("mode", "per_link") == "time":
+        train_end, val_end = time_cutoffs(df["window_start_ts"], split)
+        print(f"time split: train < {train_end}, val < {val_end}")
+        return assign_time_splits(df, "window_start_ts", train_end, val_end)
+    return assign_splits(df, group_cols=GROUP_COLS, fracs=split_fracs(params))
+
+
+def featurize(df: pd.DataFrame, params: dict, history: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Everything but the splits: the per-row part of the pipeline."""
     df["window_start_ts"] = pd.to_datetime(df["window_start_ts"])
     df["window_end_ts"] = pd.to_datetime(df["window_end_ts"])
     df.sort_values(["src_node", "dst_node", "window_start_ts"], inplace=True)
 
-    targets = ["sum_energy_Wh", "sum_duration_s"]
     df = add_lags_and_rollups(
         df,
-        group_cols=["src_node", "dst_node"],
-        targets=targets,
+        group_cols=GROUP_COLS,
+        targets=TARGETS,
         max_lag=int(params["features"]["max_lag"]),
         rolling=int(params["features"]["rolling"]),
+        history=history,
     )
 
     df["hour"] = df["window_start_ts"].dt.hour
     df["dow"] = df["window_start_ts"].dt.dayofweek
     df["month"] = df["window_start_ts"].dt.month
 
-    kpi_path = Path(params.get("features", {}).get("kpi_path", ""))
-    df = maybe_join_kpis(df, kpi_path)
+    return maybe_join_kpis(df, **kpi_args(params))
+
+
+def build_features(params: dict) -> None:
+    gold_path = Path(params["data"]["gold_path"])
+    features_path = Path(params["data"]["features_path"])
+    features_path.parent.mkdir(parents=True, exist_ok=True)
+
+    df = featurize(load_gold(gold_path, **gold_scan_args(params)), params)
+    df = apply_splits(df, params)
+    df.to_parquet(features_path, index=False)
+
+
+# --- Incremental mode ---
+# Gold is partitioned by date (scripts/spark_gold_job.py). Each gold partition
+# is featurized once into <dataset_path>/<partition>/part-0.parquet. The state
+# next to it is:
+#   _manifest.json        processed partitions (file names/sizes/mtimes), params
+#                         fingerprint, output column order, current tail file
+#   _tail-<n>.parquet     last max(max_lag, rolling - 1) gold rows per link
+# New partitions are featurized with the tail as history, so lags and windows
+# that reach back into older partitions come out exactly as in a full build.
+# Splits depend on every row of a link and are assigned when the dataset is
+# collected into features_path.
+
+def advance_tail(tail: Optional[pd.DataFrame], gold: pd.DataFrame, params: dict) -> pd.DataFrame:
+    """Append a newer gold chunk to the per-link tail and keep the last max(max_lag, rolling - 1) rows of each link."""
+    depth = max(int(params["features"]["max_lag"]), int(params["features"]["rolling"]) - 1)
+    keep = GROUP_COLS + ["window_start_ts"] + TARGETS
+    latest = gold[keep].sort_values(GROUP_COLS + ["window_start_ts"], kind="stable")
+    tail = pd.concat([tail, latest], ignore_index=True) if tail is not None else latest
+    return tail.groupby(GROUP_COLS, sort=False).tail(depth)
+
+
+def _gold_partitions(gold_path: Path) -> Dict[str, List[list]]:
+    parts = {}
+    for p in sorted(gold_path.iterdir()):
+        if p.is_dir() and "=" in p.name and not p.name.startswith(("_", ".")):
+            parts[p.name] = [[str(f.relative_to(p)), f.stat().st_size, f.stat().st_mtime_ns]
+                             for f in sorted(p.rglob("*.parquet"))]
+    return parts
+
+
+def _file_stats(path: Optional[Path]) -> List[list]:
+    """[name, size, mtime_ns] of a Parquet file, or of every Parquet file under a directory."""
+    if path is None or not path.exists():
+        return []
+    files = [path] if path.is_file() else sorted(path.rglob("*.parquet"))
+    return [[str(f.relative_to(path)) if f != path else f.name, f.stat().st_size, f.stat().st_mtime_ns] for f in files]
+
+
+def _code_hash() -> str:
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def _fingerprint(params: dict) -> dict:
+    # any change to the feature code or feature params invalidates the state
+    kpi = kpi_args(params)
+    return {
+        "code": _code_hash(),
+        "max_lag": int(params["features"]["max_lag"]),
+        "rolling": int(params["features"]["rolling"]),
+        "targets": TARGETS,
+        "kpi": [str(kpi["kpi_path"])] + _file_stats(kpi["kpi_path"]) if kpi["kpi_path"] else None,
+        "kpi_join": [str(kpi["tolerance"]), kpi["key_col"], kpi["time_col"]],
+        "columns": params.get("data", {}).get("columns") or None,
+    }
 
-    df = assign_splits(
-        df,
-        group_cols=["src_node", "dst_node"],
-        fracs={
-            "train": float(params["split"]["train_frac"]),
-            "val": float(params["split"]["val_frac"]),
-            "test": float(params["split"]["test_frac"]),
-        },
-    )
 
+def _read_partitions(root: Path, names: List[str], columns: Optional[List[str]] = None,
+                     date_from=None, date_to=None) -> pd.DataFrame:
+    files = [str(f) for name in names for f in sorted((root / name).rglob("*.parquet"))]
+    dataset = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=str(root))
+    # the same date range as load_gold, so the rows match a full build
+    expr = _date_filter(dataset.schema, date_from, date_to)
+    table = dataset.to_table(columns=_projection(dataset.schema, columns), filter=expr)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _in_date_range(name: str, scan: dict) -> bool:
+    key, value = name.split("=", 1)
+    if key != "date":
+        return True
+    lo, hi = scan["date_from"], scan["date_to"]
+    return (not lo or value >= pd.Timestamp(lo).date().isoformat()) and (not hi or value <= pd.Timestamp(hi).date().isoformat())
+
+
+def build_features_incremental(params: dict, rebuild: bool = False) -> None:
+    gold_path = Path(params["data"]["gold_path"])
+    features_path = Path(params["data"]["features_path"])
+    dataset_path = Path(params["features"].get("dataset_path", features_path.parent / "by_date"))
+    manifest_path = dataset_path / "_manifest.json"
+    if not gold_path.exists():
+        raise FileNotFoundError(f"Gold path not found: {gold_path}")
+
+    scan = gold_scan_args(params)
+    gold_parts = _gold_partitions(gold_path)
+    if not gold_parts:
+        print(f"{gold_path} is not partitioned; running a full build")
+        build_features(params)
+        return
+    gold_parts = {name: files for name, files in gold_parts.items() if _in_date_range(name, scan)}
+    if not gold_parts:
+        raise ValueError(f"no gold partitions between data.date_from={scan['date_from']} and data.date_to={scan['date_to']}")
+
+    fingerprint = _fingerprint(params)
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else None
+    reason = None
+    if rebuild:
+        reason = "--rebuild"
+    elif manifest is None:
+        reason = "no manifest"
+    elif manifest["fingerprint"] != fingerprint:
+        reason = "feature code or params changed"
+    elif any(gold_parts.get(name) != files for name, files in manifest["partitions"].items()):
+        reason = "processed gold partitions changed"
+    elif manifest["partitions"] and min(set(gold_parts) - set(manifest["partitions"]), default="~") < max(manifest["partitions"]):
+        reason = "new partition is older than processed ones"
+    if reason:
+        print(f"full rebuild of {dataset_path}: {reason}")
+        shutil.rmtree(dataset_path, ignore_errors=True)
+        manifest = {"fingerprint": fingerprint, "partitions": {}, "columns": None, "tail": None, "seq": 0}
+    dataset_path.mkdir(parents=True, exist_ok=True)
+
+    new = [name for name in gold_parts if name not in manifest["partitions"]]
+    if new:
+        tail = pd.read_parquet(dataset_path / manifest["tail"]) if manifest["tail"] else None
+        gold = _read_partitions(gold_path, new, **scan)
+        part_col = new[0].split("=", 1)[0]
+        df = featurize(gold.copy(), params, history=tail)
+
+        for name in new:
+            part = df[df[part_col].astype(str) == name.split("=", 1)[1]].drop(columns=[part_col])
+            out = dataset_path / name / "part-0.parquet"
+            out.parent.mkdir(parents=True, exist_ok=True)
+            part.to_parquet(out, index=False)
+
+        tail = advance_tail(tail, gold, params)
+
+        # the manifest is written last and atomically: an interrupted run redoes the same partitions
+        old_tail = manifest["tail"]
+        manifest["seq"] += 1
+        manifest["tail"] = f"_tail-{manifest['seq']}.parquet"
+        tail.to_parquet(dataset_path / manifest["tail"], index=False)
+        manifest["columns"] = manifest["columns"] or list(df.columns)
+        manifest["partitions"].update({name: gold_parts[name] for name in new})
+        tmp = manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp, manifest_path)
+        if old_tail:
+            (dataset_path / old_tail).unlink(missing_ok=True)
+    print(f"featurized {len(new)} new partition(s); {len(manifest['partitions'])} in {dataset_path}")
+
+    df = _read_partitions(dataset_path, sorted(manifest["partitions"]))[manifest["columns"]]
+    df = apply_splits(df, params)
+    features_path.parent.mkdir(parents=True, exist_ok=True)
     df.to_parquet(features_path, index=False)
 
 
+# --- Streaming mode ---
+# Bounded-memory full build for gold tables that don't fit in RAM. Gold is
+# read in time-ordered chunks: several small date= partitions at once, or time
+# slices of one partition that alone exceeds the budget. Each chunk is
+# featurized with the per-link tail of the previous chunks as history and
+# appended to features_path as row groups. A pre-pass over the link keys
+# counts each link's rows, so per-link splits can be labelled chunk by chunk.
+# The output equals build_features'.
+
+Piece = Tuple[List[str], Optional[pd.Timestamp], Optional[pd.Timestamp]]  # files, [lo, hi) on window_start_ts or whole files
+
+
+def _chunk_rows(n_gold_cols: int, params: dict) -> int:
+    # rough bytes per featurized row, times the ~4 copies alive while a chunk is processed
+    budget = float(params["features"].get("memory_budget_mb", 1024)) * 2**20
+    n_cols = n_gold_cols + len(TARGETS) * (int(params["features"]["max_lag"]) + 2) + 5
+    return max(1000, int(budget / (8 * n_cols * 4)))
+
+
+def _num_rows(files: List[str]) -> int:
+    return sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+
+
+def _ts_range(paths: List[str]) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """[first, last] window_start_ts of some gold files (one column scanned)."""
+    col = ds.dataset(paths, format="parquet").to_table(columns=["window_start_ts"])["window_start_ts"]
+    lo, hi = (v.as_py() for v in pc.min_max(col).values())
+    return (pd.Timestamp(lo), pd.Timestamp(hi)) if lo is not None else (None, None)
+
+
+def _stream_chunks(gold_path: Path, scan: dict, chunk_rows: int, ts_range) -> List[List[Piece]]:
+    # a date= partition is read whole: its rows are not assumed to lie in [date, date + 1) UTC,
+    # since the gold job derives `date` in the Spark session time zone
+    parts = _gold_partitions(gold_path)
+    units = []
+    if parts:
+        for name, files in parts.items():
+            if _in_date_range(name, scan):
+                paths = [str(gold_path / name / f[0]) for f in files]
+                units.append((paths, None, _num_rows(paths)))
+    else:
+        units.append((ds.dataset(gold_path, format="parquet").files, ts_range, None))
+
+    chunks: List[List[Piece]] = []
+    current: List[Piece] = []
+    rows = 0
+    for paths, span, n in units:
+        n = _num_rows(paths) if n is None else n
+        # too large alone: time slices over the files' actual window_start_ts range
+        lo, hi = (span or _ts_range(paths)) if n > chunk_rows else (None, None)
+        if lo is not None:
+            if current:
+                chunks.append(current)
+                current, rows = [], 0
+            hi = hi + pd.Timedelta(microseconds=1)
+            k = -(-n // chunk_rows)
+            edges = [lo + (hi - lo) * i / k for i in range(k + 1)]
+            chunks.extend([[(paths, a, b)] for a, b in zip(edges[:-1], edges[1:])])
+            continue
+        if current and rows + n > chunk_rows:
+            chunks.append(current)
+            current, rows = [], 0
+        current.append((paths, None, None))
+        rows += n
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _read_chunk(gold_path: Path, pieces: List[Piece], scan: dict) -> pd.DataFrame:
+    tables = []
+    for paths, lo, hi in pieces:
+        dataset = ds.dataset(paths, format="parquet", partitioning="hive", partition_base_dir=str(gold_path))
+        expr = _date_filter(dataset.schema, scan["date_from"], scan["date_to"])
+        if lo is not None:
+            e = (ds.field("window_start_ts") >= _scalar(dataset.schema, "window_start_ts", lo)) & (
+                ds.field("window_start_ts") < _scalar(dataset.schema, "window_start_ts", hi))
+            expr = e if expr is None else expr & e
+        tables.append(dataset.to_table(columns=_projection(dataset.schema, scan["columns"]), filter=expr))
+    return pa.concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _link_index(df: pd.DataFrame) -> pd.MultiIndex:
+    return pd.MultiIndex.from_frame(df[GROUP_COLS])
+
+
+def _count_links(counts: Optional[pd.Series], df: pd.DataFrame) -> pd.Series:
+    # running rows per link, indexed by GROUP_COLS (links with a null key are not counted)
+    new = df.value_counts(GROUP_COLS, sort=False)
+    return new if counts is None else counts.add(new, fill_value=0).astype(np.int64)
+
+
+def _key_pass(dataset: ds.Dataset, scan: dict, split: dict, batch_rows: int):
+    """One scan of the link keys and timestamps: (rows per link, time-mode cutoffs or None, (first ts, last ts))."""
+    time_mode = split.get("mode", "per_link") == "time"
+    totals = None
+    stamps = set()
+    ts_lo = ts_hi = None
+    for batch in dataset.to_batches(columns=GROUP_COLS + ["window_start_ts"], batch_size=batch_rows,
+                                    filter=_date_filter(dataset.schema, scan["date_from"], scan["date_to"])):
+        keys = batch.to_pandas()
+        totals = _count_links(totals, keys)
+        ts = pd.to_datetime(keys["window_start_ts"])
+        if len(ts):
+            ts_lo = ts.min() if ts_lo is None else min(ts_lo, ts.min())
+            ts_hi = ts.max() if ts_hi is None else max(ts_hi, ts.max())
+        if time_mode and not (split.get("train_end") and split.get("val_end")):
+            stamps.update(ts.unique())
+    if ts_lo is None:
+        raise ValueError("no gold rows for the configured date range")
+    cutoffs = None
+    if time_mode:
+        cutoffs = time_cutoffs(pd.Series(sorted(stamps) or [ts_lo]), split)
+        print(f"time split: train < {cutoffs[0]}, val < {cutoffs[1]}")
+    return totals, cutoffs, (ts_lo, ts_hi)
+
+
+def build_features_streaming(params: dict) -> None:
+    gold_path = Path(params["data"]["gold_path"])
+    features_path = Path(params["data"]["features_path"])
+    if not gold_path.exists():
+        raise FileNotFoundError(f"Gold path not found: {gold_path}")
+    scan = gold_scan_args(params)
+    split = params["split"]
+
+    dataset = ds.dataset(gold_path, format="parquet", partitioning="hive")
+    chunk_rows = _chunk_rows(len(_projection(dataset.schema, scan["columns"]) or dataset.schema.names), params)
+    totals, cutoffs, (ts_lo, ts_hi) = _key_pass(dataset, scan, split, chunk_rows)
+
+    chunks = _stream_chunks(gold_path, scan, chunk_rows, (ts_lo, ts_hi))
+    print(f"streaming {int(totals.sum()):,} gold rows in {len(chunks)} chunk(s) of <= {chunk_rows:,} rows")
+    features_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = features_path.with_name(features_path.name + ".tmp")
+    writer, schema, tail = None, None, None
+    seen, last_ts = None, None
+    try:
+        for pieces in chunks:
+            gold = _read_chunk(gold_path, pieces, scan)
+            if gold.empty:
+                continue
+            # chunks are featurized in order, each after the tails of the earlier ones: that only
+            # equals a full build while they do not overlap in time
+            ts = gold["window_start_ts"]
+            if last_ts is not None and ts.min() < last_ts:
+                raise ValueError(f"gold partitions overlap in time (a row at {ts.min()} after one at {last_ts}); "
+                                 "use the full build (features.stream: false)")
+            last_ts = ts.max()
+            df = featurize(gold.copy(), params, history=tail)
+            tail = advance_tail(tail, gold, params)
+            del gold
+
+            if cutoffs is not None:
+                df = assign_time_splits(df, "window_start_ts", *cutoffs)
+            else:
+                _, rank, _ = group_ranks(df[GROUP_COLS])
+                links = _link_index(df)
+                n = totals.reindex(links, fill_value=0).to_numpy()
+                prior = seen.reindex(links, fill_value=0).to_numpy() if seen is not None else 0
+                rank = np.where(rank >= 0, rank + prior, -1)
+                df = df.assign(split=SPLIT_LABELS[split_codes(rank, n, split_fracs(params))])
+                seen = _count_links(seen, df)
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            del df
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(tmp, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, features_path)
+
+
+# --- Parallel mode ---
+# Links are independent until the output is assembled, so the full build can
+# be sharded by link over a process pool. Link (src, dst) goes to shard
+# crc32("<src>\x1f<dst>") % workers. The parent scans gold once, in batches,
+# and writes each shard's rows to its own gold fragment; each worker reads only
+# its fragment, featurizes and splits it, and writes one feature fragment.
+# Hash-sharded links are spread over every gold row group, so a per-worker
+# filter could not prune anything and N workers would each decode the whole
+# table; the cost here is one extra write and read of the projected gold rows.
+# The fragments are merged in the row order of build_features
+# (window_start_ts, src_node, dst_node), so the output does not depend on the
+# number of workers. Rows with a null key all go to shard 0.
+
+# "<src>\x1f<dst>": one string per link, for shard hashing
+LINK_SEP = "\x1f"
+SHARD_BATCH_ROWS = 1 << 18
+
+
+def link_shard(src: str, dst: str, workers: int) -> int:
+    return zlib.crc32(f"{src}{LINK_SEP}{dst}".encode()) % workers
+
+
+def _shard_gold(dataset: ds.Dataset, scan: dict, workers: int, outs: List[str]) -> List[int]:
+    """One scan of gold: every row goes to the fragment of its link's shard; returns rows per shard."""
+    writers: List[Optional[pq.ParquetWriter]] = [None] * workers
+    rows = [0] * workers
+    try:
+        for batch in dataset.to_batches(columns=_projection(dataset.schema, scan["columns"]), batch_size=SHARD_BATCH_ROWS,
+                                        filter=_date_filter(dataset.schema, scan["date_from"], scan["date_to"])):
+            keys = batch.select(GROUP_COLS).to_pandas()
+            codes, _, _ = group_ranks(keys)
+            uniq, first = np.unique(codes, return_index=True)
+            ok = uniq >= 0
+            shard_of = np.zeros(codes.max(initial=-1) + 2, dtype=np.int64)  # code -1 (null key) picks the trailing 0
+            shard_of[uniq[ok]] = [link_shard(src, dst, workers) for src, dst in keys.iloc[first[ok]].itertuples(index=False)]
+            shard = shard_of[codes]
+            for i in np.unique(shard):
+                part = batch.filter(pa.array(shard == i))
+                if writers[i] is None:
+                    writers[i] = pq.ParquetWriter(outs[i], batch.schema)
+                writers[i].write_batch(part)
+                rows[i] += part.num_rows
+    finally:
+        for w in writers:
+            if w is not None:
+                w.close()
+    return rows
+
+
+def _featurize_shard(params: dict, gold_path: str, cutoffs, out: str) -> int:
+    gold = load_gold(Path(gold_path))
+    if gold.empty:
+        return 0
+    df = featurize(gold, params)
+    if cutoffs is not None:
+        df = assign_time_splits(df, "window_start_ts", *cutoffs)
+    else:
+        df = assign_splits(df, group_cols=GROUP_COLS, fracs=split_fracs(params))
+    df.to_parquet(out, index=False)
+    return len(df)
+
+
+def build_features_parallel(params: dict, workers: int) -> None:
+    gold_path = Path(params["data"]["gold_path"])
+    features_path = Path(params["data"]["features_path"])
+    if not gold_path.exists():
+        raise FileNotFoundError(f"Gold path not found: {gold_path}")
+    scan = gold_scan_args(params)
+    dataset = ds.dataset(gold_path, format="parquet", partitioning="hive")
+    totals, cutoffs, _ = _key_pass(dataset, scan, params["split"], 1 << 20)
+
+    parts = features_path.with_name(features_path.name + ".parts")
+    shutil.rmtree(parts, ignore_errors=True)
+    parts.mkdir(parents=True)
+    golds = [str(parts / f"gold-{i:05d}.parquet") for i in range(workers)]
+    outs = [str(parts / f"part-{i:05d}.parquet") for i in range(workers)]
+    gold_rows = _shard_gold(dataset, scan, workers, golds)
+    jobs = [i for i in range(workers) if gold_rows[i]]
+    # spawn: workers must not inherit the parent's Arrow thread pools
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        done = list(pool.map(_featurize_shard, [params] * len(jobs), [golds[i] for i in jobs],
+                             [cutoffs] * len(jobs), [outs[i] for i in jobs]))
+    rows = [0] * workers
+    for i, n in zip(jobs, done):
+        rows[i] = n
+    print(f"featurized {sum(rows):,} rows of {len(totals):,} links in {workers} shard(s): {rows}")
+
+    table = pa.concat_tables([pq.read_table(out) for out, n in zip(outs, rows) if n], promote_options="default")
+    # stable, nulls last: the order featurize + the window_start_ts sort produce
+    order = pc.sort_indices(table, sort_keys=[("window_start_ts", "ascending"), ("src_node", "ascending"),
+                                              ("dst_node", "ascending")])
+    pq.write_table(table.take(order), features_path)
+    shutil.rmtree(parts)
+
+
+# --- Feature cache ---
+# features.parquet is content-addressed. The key hashes the feature code, the
+# gold and KPI file stats (plus the Delta log version), and the data/features/
+# split params, minus the ones that only choose how the build runs. A build
+# whose key is already in features.cache_dir copies that entry to
+# features_path instead of rebuilding. Entries are evicted least recently used
+# first once the cache exceeds features.cache_quota_gb.
+
+# params that change how features are built, never what is built
+BUILD_ONLY_PARAMS = {"incremental", "dataset_path", "stream", "memory_budget_mb", "workers", "cache_dir", "cache_quota_gb",
+                     "store_path", "store_row_group_rows", "store_ipc"}
+
+
+def _delta_version(table_path: Path) -> Optional[int]:
+    log = table_path / "_delta_log"
+    versions = [int(f.stem) for f in log.glob("*.json") if f.stem.isdigit()] if log.is_dir() else []
+    return max(versions) if versions else None
+
+
+def feature_cache_key(params: dict) -> str:
+    gold_path = Path(params["data"]["gold_path"])
+    doc = {
+        "code": _code_hash(),
+        "gold": _file_stats(gold_path),
+        "delta_version": _delta_version(gold_path),
+        "kpi": _file_stats(kpi_args(params)["kpi_path"]),
+        "data": {k: v for k, v in params.get("data", {}).items() if k != "features_path"},
+        "features": {k: v for k, v in params.get("features", {}).items() if k not in BUILD_ONLY_PARAMS},
+        "split": params.get("split", {}),
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _copy_atomic(src: Path, dst: Path) -> None:
+    tmp = dst.with_name(dst.name + ".tmp")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def evict_cache(cache_dir: Path, quota_bytes: int, keep: Optional[Path] = None) -> int:
+    """Delete the least recently used entries until the cache fits in `quota_bytes`; never `keep`."""
+    entries = sorted(cache_dir.glob("*.parquet"), key=lambda p: p.stat().st_mtime_ns)
+    total = sum(p.stat().st_size for p in entries)
+    evicted = 0
+    for entry in entries:
+        if total <= quota_bytes:
+            break
+        if entry == keep:
+            continue
+        total -= entry.stat().st_size
+        entry.unlink()
+        entry.with_suffix(".json").unlink(missing_ok=True)
+        evicted += 1
+    return evicted
+
+
+def cached_build(params: dict, build: Callable[[], None]) -> None:
+    """Run `build` (which writes features_path) unless features.cache_dir has its output already."""
+    features = params.get("features", {})
+    if not features.get("cache_dir"):
+        build()
+        return
+    cache_dir = Path(features["cache_dir"])
+    features_path = Path(params["data"]["features_path"])
+    key = feature_cache_key(params)
+    entry = cache_dir / f"{key}.parquet"
+    if entry.exists():
+        features_path.parent.mkdir(parents=True, exist_ok=True)
+        _copy_atomic(entry, features_path)
+        os.utime(entry)  # mtime = last use, for the LRU
+        print(f"feature cache hit {key[:12]}: {entry} -> {features_path}")
+        return
+
+    build()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _copy_atomic(features_path, entry)
+    gold_path = Path(params["data"]["gold_path"])
+    entry.with_suffix(".json").write_text(json.dumps({
+        "gold_path": str(gold_path),
+        "delta_version": _delta_version(gold_path),
+        "data": params.get("data", {}),
+        "features": features,
+        "split": params.get("split", {}),
+    }, indent=2, default=str))
+    evicted = evict_cache(cache_dir, int(float(features.get("cache_quota_gb", 20)) * 2**30), keep=entry)
+    print(f"feature cache store {key[:12]}: {entry} (evicted {evicted} least recently used)")
+
+
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser()
     ap.add_argument("--params", default="params.yaml", help="Path to params YAML.")
+    ap.add_argument("--incremental", action="store_true", help="Only featurize new gold partitions (features.incremental).")
+    ap.add_argument("--rebuild", action="store_true", help="With --incremental: drop the state and start over.")
+    ap.add_argument("--stream", action="store_true", help="Bounded-memory full build (features.stream / memory_budget_mb).")
+    ap.add_argument("--no-cache", action="store_true", help="Always build; don't read or write features.cache_dir (implied by --rebuild).")
+    ap.add_argument("--workers", type=int, default=None, help="Full build sharded by link over N processes (features.workers).")
     return ap.parse_args()
 
 
 def main() -> int:
     args = parse_args()
     params = read_params(Path(args.params))
-    build_features(params)
+    if args.no_cache or args.rebuild:
+        params["features"]["cache_dir"] = None
+    workers = args.workers if args.workers is not None else int(params.get("features", {}).get("workers", 1))
+    if args.incremental or params.get("features", {}).get("incremental", False):
+        build = lambda: build_features_incremental(params, rebuild=args.rebuild)
+    elif args.stream or params.get("features", {}).get("stream", False):
+        build = lambda: build_features_streaming(params)
+    elif workers > 1:
+        build = lambda: build_features_parallel(params, workers)
+    else:
+        build = lambda: build_features(params)
+    cached_build(params, build)
+    store_path = params["features"].get("store_path")
+    if store_path:
+        links = write_store(Path(params["data"]["features_path"]), Path(store_path),
+                            int(params["features"].get("store_row_group_rows", 131072)),
+                            ipc=bool(params["features"].get("store_ipc", True)),
+                            memory_budget_mb=float(params["features"].get("memory_budget_mb", 1024)))
+        print(f"Wrote feature store {store_path} ({links:,} link/split ranges)")
     return 0
 
 
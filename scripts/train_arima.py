@@ -2,15 +2,22 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
+import shutil
+import time
+from collections import Counter
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
 import yaml
 
+from feature_store import iter_links
+from link_scheduler import job_report, run_jobs
+
 
 def read_params(path: Path) -> dict:
     with open(path, "r") as f:
@@ -28,56 +35,135 @@ def train_series(y: pd.Series, order=(1, 0, 1)):
     return model.fit()
 
 
+def _history(y: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(y, dtype=np.float64).tobytes()).hexdigest()
+
+
+def update_series(y: np.ndarray, order, model_path: Path, state: Optional[dict], cfg: dict, now: float) -> Tuple[object, str]:
+    """Extend the saved results with the new tail of `y` when possible, else refit.
+
+    Returns the results and how they were obtained: "fit" (no usable previous
+    model), "extend", or "refit:<reason>" (a refit warm-started from the
+    previous parameters).
+    """
+    if not state or not model_path.exists():
+        return train_series(y, order=order), "fit"
+    from statsmodels.tsa.arima.model import ARIMAResults
+    prev = ARIMAResults.load(model_path)
+    n = int(state["n_obs"])
+    if list(state["order"]) != list(order):
+        return train_series(y, order=order), "refit:order"
+    if len(y) < n or _history(y[:n]) != state["history"]:
+        # the already-absorbed history changed (a rebuild, not an append)
+        reason = "history"
+    elif now - float(state["fitted_at"]) > float(cfg.get("refit_max_age_days", 7)) * 86400:
+        reason = "age"
+    else:
+        # the Kalman filter runs over the new points only; the parameters are kept
+        ext = prev.extend(y[n:]) if len(y) > n else prev
+        sigma = np.sqrt(dict(zip(prev.param_names, prev.params))["sigma2"])
+        resid = np.asarray(ext.resid)[-(len(y) - n):] if len(y) > n else np.empty(0)
+        drift = float(np.sqrt(np.nanmean(resid ** 2)) / sigma) if np.isfinite(resid).any() and sigma > 0 else 0.0
+        if drift <= float(cfg.get("drift_threshold", 2.0)):
+            return ext, "extend"
+        reason = "drift"
+    try:
+        return sm.tsa.ARIMA(y, order=order).fit(start_params=prev.params), f"refit:{reason}"
+    except Exception:
+        return train_series(y, order=order), f"refit:{reason}"
+
+
+def fit_link(job: dict) -> dict:
+    """One (link, target) job: fit or update on train + val, score the test forecast, save the model."""
+    # plain arrays: the frame's sorted, gappy index is unsupported by statsmodels and
+    # leaves results that cannot forecast after save/load or be extended when served
+    y = job["y_train"]
+    if job["incremental"]:
+        fitted, update = update_series(y, job["order"], job["model_path"], job["state"], job["cfg"], job["now"])
+    else:
+        fitted, update = train_series(y, order=job["order"]), "fit"
+    y_true = job["y_test"]
+    y_pred = np.array(fitted.forecast(steps=len(y_true)))
+    fitted.save(job["model_path"])
+    state = {"order": list(job["order"]), "n_obs": len(y), "history": _history(y),
+             "fitted_at": job["now"] if update != "extend" else job["state"]["fitted_at"]}
+    metrics = {
+        "mae": float(np.mean(np.abs(y_true - y_pred))),
+        "rmse": float(np.sqrt(np.mean((y_true - y_pred) ** 2))),
+        "smape": smape(y_true, y_pred),
+        "update": update,
+    }
+    return {"metrics": metrics, "state": state}
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--params", default="params.yaml")
+    ap.add_argument("--workers", type=int, default=None, help="overrides train.workers")
+    ap.add_argument("--incremental", action="store_true", help="overrides arima.incremental")
     args = ap.parse_args()
 
     params = read_params(Path(args.params))
-    features_path = Path(params["data"]["features_path"])
-    df = pd.read_parquet(features_path)
-    df.sort_values(["src_node", "dst_node", "window_start_ts"], inplace=True)
 
     out_dir = Path("models/arima")
     out_dir.mkdir(parents=True, exist_ok=True)
     metrics_dir = Path("reports/metrics")
     metrics_dir.mkdir(parents=True, exist_ok=True)
 
-    order = tuple(params.get("arima", {}).get("order", (1, 0, 1)))
+    cfg = params.get("arima", {})
+    order = tuple(cfg.get("order", (1, 0, 1)))
+    incremental = bool(args.incremental or cfg.get("incremental", False))
     targets = ["sum_energy_Wh", "sum_duration_s"]
-    results: Dict[str, Dict] = {}
+    results: Dict[str, Dict] = {target: {} for target in targets}
 
+    # per (target, link): order, observations absorbed, their hash and the time of the last full fit
+    state_path = out_dir / "_state.json"
+    state = json.loads(state_path.read_text()) if incremental and state_path.exists() else {}
     for target in targets:
-        target_dir = out_dir / target
-        target_dir.mkdir(parents=True, exist_ok=True)
-        results[target] = {}
-        for (src, dst), grp in df.groupby(["src_node", "dst_node"]):
-            train_mask = grp["split"].isin(["train", "val"])
-            test_mask = grp["split"] == "test"
-            if test_mask.sum() == 0 or train_mask.sum() < 3:
-                continue
-            y_train = grp.loc[train_mask, target]
-            y_test = grp.loc[test_mask, target]
-
-            try:
-                fitted = train_series(y_train, order=order)
-                forecast = fitted.forecast(steps=len(y_test))
-            except Exception:
-                continue
-
-            y_true = y_test.to_numpy()
-            y_pred = np.array(forecast)
-
-            mae = float(np.mean(np.abs(y_true - y_pred)))
-            rmse = float(np.sqrt(np.mean((y_true - y_pred) ** 2)))
-            results[target][f"{src}_{dst}"] = {
-                "mae": mae,
-                "rmse": rmse,
-                "smape": smape(y_true, y_pred),
-            }
-
-            model_path = target_dir / f"{src}_{dst}.pkl"
-            fitted.save(model_path)
+        if not incremental:
+            # models/arima persists across runs for incremental updates; a full run starts clean
+            shutil.rmtree(out_dir / target, ignore_errors=True)
+        (out_dir / target).mkdir(parents=True, exist_ok=True)
+    now = time.time()
+
+    # one pass over the links, in time order within each link
+    jobs = []
+    for src, dst, parts in iter_links(params, ["train", "val", "test"], columns=targets):
+        train = pd.concat([parts["train"], parts["val"]])
+        test = parts["test"]
+        if len(test) == 0 or len(train) < 3:
+            continue
+        for target in targets:
+            jobs.append({
+                "target": target,
+                "link": f"{src}_{dst}",
+                "cost": len(train),
+                "y_train": train[target].to_numpy(),
+                "y_test": test[target].to_numpy(),
+                "order": order,
+                "model_path": out_dir / target / f"{src}_{dst}.pkl",
+                "incremental": incremental,
+                "state": state.get(target, {}).get(f"{src}_{dst}"),
+                "cfg": cfg,
+                "now": now,
+            })
+
+    sched = params.get("train", {})
+    workers = int(args.workers or sched.get("workers", 1))
+    threads = int(sched.get("threads_per_worker", 1))
+    timeout_s = sched.get("job_timeout_s")
+    t0 = time.perf_counter()
+    done = []
+    for r in run_jobs(fit_link, jobs, workers=workers, threads=threads, timeout_s=timeout_s):
+        done.append(r)
+        if r["status"] == "ok":
+            results[r["target"]][r["link"]] = {**r["result"]["metrics"], "duration_s": r["duration_s"]}
+            state.setdefault(r["target"], {})[r["link"]] = r["result"]["state"]
+    # links stay in key order whatever order the jobs finished in
+    results = {target: dict(sorted(links.items())) for target, links in results.items()}
+    results["jobs"] = job_report(done, workers, threads, timeout_s, time.perf_counter() - t0)
+    results["jobs"]["updates"] = dict(Counter(m["update"] for t in targets for m in results[t].values()))
+    state_path.write_text(json.dumps({t: dict(sorted(links.items())) for t, links in state.items()}, indent=1))
 
     metrics_path = metrics_dir / "arima.json"
     with open(metrics_path, "w") as f:
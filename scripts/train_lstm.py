@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import argparse
 import json
+import time
 from pathlib import Path
 from typing import Dict, List, Tuple
 
@@ -10,7 +11,7 @@ import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, SequentialSampler
 import yaml
 
 
@@ -26,25 +27,67 @@ def smape(y_true: np.ndarray, y_pred: np.ndarray) -> float:
 
 
 class SeqDataset(Dataset):
+    """Windows x = series[i : i + seq_len] with target y = series[i + seq_len].
+
+    The series is held once as a float32 tensor and `windows` is a strided
+    view of it (`unfold`), so memory stays O(len(series)) whatever seq_len.
+    Indexing with a list or tensor of positions gathers a whole batch at once;
+    `batch_loader` feeds it batches that way instead of collating samples.
+    """
     def __init__(self, series: np.ndarray, seq_len: int):
         self.seq_len = seq_len
-        self.series = series
-        self.samples = self._build_samples()
+        self.series = torch.from_numpy(np.array(series, dtype=np.float32))
+        n = max(len(self.series) - seq_len, 0)
+        self.windows = self.series[: n + seq_len - 1].unfold(0, seq_len, 1) if n else self.series.new_empty((0, seq_len))
+        self.targets = self.series[seq_len:]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        if not isinstance(idx, int):
+            idx = torch.as_tensor(idx, dtype=torch.long)
+        return self.windows[idx].unsqueeze(-1), self.targets[idx]
+
 
-    def _build_samples(self) -> List[Tuple[np.ndarray, float]]:
-        samples = []
-        for i in range(len(self.series) - self.seq_len):
-            x = self.series[i : i + self.seq_len]
-            y = self.series[i + self.seq_len]
-            samples.append((x.astype(np.float32), float(y)))
-        return samples
+def batch_loader(ds: SeqDataset, batch_size: int, shuffle: bool) -> DataLoader:
+    """Same batches (and shuffling RNG use) as DataLoader(ds, batch_size, shuffle), one gather per batch."""
+    sampler = RandomSampler(ds) if shuffle else SequentialSampler(ds)
+    return DataLoader(ds, sampler=BatchSampler(sampler, batch_size, drop_last=False), batch_size=None)
+
+
+class GlobalSeqDataset(Dataset):
+    """Windows from every link over one [rows, features] float32 tensor (column 0 is the target).
+
+    Links' rows are stacked one after another and `windows` is a strided view
+    over the whole block, like SeqDataset. `starts` keeps only windows that
+    stay inside one link and whose inputs and target are finite; an item is
+    (window, link id, target), so a shuffled batch mixes links.
+    """
+    def __init__(self, values: np.ndarray, spans: List[Tuple[int, int, int]], seq_len: int):
+        self.seq_len = seq_len
+        self.values = torch.from_numpy(np.ascontiguousarray(values, dtype=np.float32))
+        n = max(len(self.values) - seq_len, 0)
+        self.windows = (self.values[: n + seq_len - 1].unfold(0, seq_len, 1).transpose(1, 2) if n
+                        else self.values.new_empty((0, seq_len, self.values.shape[1])))
+        bad = np.concatenate([[0], np.cumsum(~np.isfinite(values).all(axis=1))])
+        starts, links = [], []
+        for offset, count, link_id in spans:
+            s = np.arange(offset, offset + max(count - seq_len, 0))
+            s = s[bad[s + seq_len + 1] == bad[s]]
+            starts.append(s)
+            links.append(np.full(len(s), link_id))
+        self.starts = torch.from_numpy(np.concatenate(starts).astype(np.int64)) if starts else torch.empty(0, dtype=torch.long)
+        self.link_ids = torch.from_numpy(np.concatenate(links).astype(np.int64)) if links else torch.empty(0, dtype=torch.long)
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.starts)
 
     def __getitem__(self, idx):
-        x, y = self.samples[idx]
-        return torch.tensor(x).unsqueeze(-1), torch.tensor(y)
+        if not isinstance(idx, int):
+            idx = torch.as_tensor(idx, dtype=torch.long)
+        start = self.starts[idx]
+        return self.windows[start], self.link_ids[idx], self.values[start + self.seq_len, 0]
 
 
 class LSTMReg(nn.Module):
@@ -59,25 +102,38 @@ class LSTMReg(nn.Module):
         return self.head(out).squeeze(-1)
 
 
+class GlobalLSTMReg(nn.Module):
+    """LSTMReg shared by all links: a learned link embedding is appended to every step's inputs."""
+    def __init__(self, n_links: int, embedding_dim: int, input_size: int, hidden_size: int, num_layers: int):
+        super().__init__()
+        self.embedding = nn.Embedding(n_links, embedding_dim)
+        self.lstm = nn.LSTM(input_size + embedding_dim, hidden_size, num_layers=num_layers, batch_first=True)
+        self.head = nn.Linear(hidden_size, 1)
+
+    def forward(self, x, link):
+        emb = self.embedding(link).unsqueeze(1).expand(-1, x.shape[1], -1)
+        out, _ = self.lstm(torch.cat([x, emb], dim=-1))
+        return self.head(out[:, -1, :]).squeeze(-1)
+
+
 def train_model(model, loader, val_loader, epochs, lr, device):
     model.to(device)
     optim = torch.optim.Adam(model.parameters(), lr=lr)
     loss_fn = nn.MSELoss()
     for _ in range(epochs):
         model.train()
-        for xb, yb in loader:
-            xb, yb = xb.to(device), yb.to(device)
+        for *xb, yb in loader:
+            xb, yb = [t.to(device) for t in xb], yb.to(device)
             optim.zero_grad()
-            pred = model(xb)
+            pred = model(*xb)
             loss = loss_fn(pred, yb)
             loss.backward()
             optim.step()
         if val_loader:
             model.eval()
             with torch.no_grad():
-                for xb, yb in val_loader:
-                    xb, yb = xb.to(device), yb.to(device)
-                    loss_fn(model(xb), yb)
+                for *xb, yb in val_loader:
+                    loss_fn(model(*[t.to(device) for t in xb]), yb.to(device))
     return model
 
 
@@ -86,74 +142,222 @@ def to_sequences(series: pd.Series, seq_len: int):
     return ds
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--params", default="params.yaml")
-    args = ap.parse_args()
+def _scale(x: np.ndarray, axis=None) -> Tuple[np.ndarray, np.ndarray]:
+    # nan-aware mean / std from the finite values; a constant or empty column scales by 1
+    ok = np.isfinite(x)
+    n = ok.sum(axis=axis)
+    mean = np.where(ok, x, 0.0).sum(axis=axis) / np.maximum(n, 1)
+    std = np.sqrt(np.where(ok, (x - mean) ** 2, 0.0).sum(axis=axis) / np.maximum(n, 1))
+    return mean, np.where(std > 0, std, 1.0)
+
+
+def fit_link(job: dict) -> dict:
+    """One (link, target) job: train on the link's own windows, score the test windows, save the model."""
+    cfg, seq_len, device = job["cfg"], job["seq_len"], job["device"]
+    train_ds = SeqDataset(job["train"], seq_len)
+    val_ds = SeqDataset(job["val"], seq_len) if len(job["val"]) > seq_len else None
+    test_ds = SeqDataset(job["test"], seq_len)
+
+    train_loader = batch_loader(train_ds, int(cfg["batch_size"]), shuffle=True)
+    val_loader = batch_loader(val_ds, int(cfg["batch_size"]), shuffle=False) if val_ds else None
+    test_loader = batch_loader(test_ds, int(cfg["batch_size"]), shuffle=False)
+
+    model = LSTMReg(input_size=1, hidden_size=int(cfg["hidden_size"]), num_layers=int(cfg["num_layers"]))
+    model = train_model(model, train_loader, val_loader, epochs=int(cfg["epochs"]), lr=float(cfg["lr"]), device=device)
+
+    preds, truth = [], []
+    model.eval()
+    with torch.no_grad():
+        for xb, yb in test_loader:
+            xb = xb.to(device)
+            out = model(xb).cpu().numpy()
+            preds.extend(out.tolist())
+            truth.extend(yb.numpy().tolist())
+
+    y_true = np.array(truth)
+    y_pred = np.array(preds)[: len(y_true)]
+
+    torch.save(
+        {
+            "model_state": model.state_dict(),
+            "seq_len": seq_len,
+            "input_size": 1,
+            "hidden_size": int(cfg["hidden_size"]),
+            "num_layers": int(cfg["num_layers"]),
+        },
+        job["model_path"],
+    )
+    return {
+        "mae": float(np.mean(np.abs(y_true - y_pred))),
+        "rmse": float(np.sqrt(np.mean((y_true - y_pred) ** 2))),
+        "smape": smape(y_true, y_pred),
+    }
+
+
+def train_per_link(params: dict, targets: List[str], out_dir: Path, device: str, workers: int = 1) -> Dict[str, Dict]:
+    # imported here: the inference service imports LSTMReg from this module without scripts/ on sys.path
+    from feature_store import iter_links
+    from link_scheduler import job_report, run_jobs
 
-    params = read_params(Path(args.params))
-    df = pd.read_parquet(Path(params["data"]["features_path"]))
-    df.sort_values(["src_node", "dst_node", "window_start_ts"], inplace=True)
+    cfg = params["lstm"]
+    seq_len = int(cfg["seq_len"])
+    metrics: Dict[str, Dict] = {target: {} for target in targets}
+    for target in targets:
+        (out_dir / target).mkdir(parents=True, exist_ok=True)
 
-    out_dir = Path("models/lstm")
-    out_dir.mkdir(parents=True, exist_ok=True)
-    metrics_dir = Path("reports/metrics")
-    metrics_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for src, dst, parts in iter_links(params, ["train", "val", "test"], columns=targets):
+        for target in targets:
+            if len(parts["train"]) <= seq_len or len(parts["test"]) == 0:
+                continue
+            jobs.append({
+                "target": target,
+                "link": f"{src}_{dst}",
+                "cost": len(parts["train"]),
+                "train": parts["train"][target].to_numpy(),
+                "val": parts["val"][target].to_numpy(),
+                "test": parts["test"][target].to_numpy(),
+                "cfg": cfg,
+                "seq_len": seq_len,
+                "device": device,
+                "model_path": out_dir / target / f"{src}_{dst}.pt",
+            })
+
+    sched = params.get("train", {})
+    threads = int(sched.get("threads_per_worker", 1))
+    timeout_s = sched.get("job_timeout_s")
+    t0 = time.perf_counter()
+    done = []
+    for r in run_jobs(fit_link, jobs, workers=workers, threads=threads, timeout_s=timeout_s):
+        done.append(r)
+        if r["status"] == "ok":
+            metrics[r["target"]][r["link"]] = {**r["result"], "duration_s": r["duration_s"]}
+    # links stay in key order whatever order the jobs finished in
+    metrics = {target: dict(sorted(links.items())) for target, links in metrics.items()}
+    metrics["jobs"] = job_report(done, workers, threads, timeout_s, time.perf_counter() - t0)
+    return metrics
+
+
+def train_global(params: dict, targets: List[str], out_dir: Path, device: str) -> Dict[str, Dict]:
+    """One GlobalLSTMReg per target over all links; writes models/lstm/<target>.pt."""
+    from feature_store import iter_links
 
     cfg = params["lstm"]
     seq_len = int(cfg["seq_len"])
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    exog = list(cfg.get("exog") or [])
+    batch_size = int(cfg.get("global_batch_size", cfg["batch_size"]))
+    splits = ["train", "val", "test"]
+
+    # --- Gather every link's rows once: [targets..., exog...] per split ---
+    links: List[str] = []
+    blocks: Dict[str, List[np.ndarray]] = {s: [] for s in splits}
+    for src, dst, parts in iter_links(params, splits, columns=targets + exog):
+        if len(parts["train"]) == 0:
+            continue
+        links.append(f"{src}_{dst}")
+        for s in splits:
+            blocks[s].append(parts[s][targets + exog].to_numpy(dtype=np.float64, na_value=np.nan))
+    if not links:
+        return {target: {} for target in targets}
+
+    # exogenous columns are standardised over all training rows; missing values become 0 (the mean)
+    exog_mean, exog_std = _scale(np.vstack(blocks["train"])[:, len(targets):], axis=0)
 
     metrics: Dict[str, Dict] = {}
-    targets = ["sum_energy_Wh", "sum_duration_s"]
-
-    for target in targets:
-        target_dir = out_dir / target
-        target_dir.mkdir(parents=True, exist_ok=True)
+    for ti, target in enumerate(targets):
+        # the target is standardised per link, so one model fits links of any scale
+        scales = [_scale(b[:, ti]) for b in blocks["train"]]
+        mean = np.array([m for m, _ in scales])
+        std = np.array([sd for _, sd in scales])
+
+        def dataset(split: str) -> GlobalSeqDataset:
+            rows, spans, offset = [], [], 0
+            for i, b in enumerate(blocks[split]):
+                y = (b[:, ti:ti + 1] - mean[i]) / std[i]
+                x = np.nan_to_num((b[:, len(targets):] - exog_mean) / exog_std)
+                rows.append(np.hstack([y, x]))
+                spans.append((offset, len(b), i))
+                offset += len(b)
+            return GlobalSeqDataset(np.vstack(rows), spans, seq_len)
+
+        train_ds, val_ds, test_ds = dataset("train"), dataset("val"), dataset("test")
         metrics[target] = {}
+        if len(train_ds) == 0 or len(test_ds) == 0:
+            continue
+
+        train_loader = batch_loader(train_ds, batch_size, shuffle=True)
+        val_loader = batch_loader(val_ds, batch_size, shuffle=False) if len(val_ds) else None
+        model = GlobalLSTMReg(
+            n_links=len(links),
+            embedding_dim=int(cfg.get("embedding_dim", 16)),
+            input_size=1 + len(exog),
+            hidden_size=int(cfg["hidden_size"]),
+            num_layers=int(cfg["num_layers"]),
+        )
+        model = train_model(model, train_loader, val_loader, epochs=int(cfg["epochs"]), lr=float(cfg["lr"]), device=device)
+
+        preds, link_ids = [], []
+        model.eval()
+        with torch.no_grad():
+            for xb, lb, _ in batch_loader(test_ds, batch_size, shuffle=False):
+                preds.append(model(xb.to(device), lb.to(device)).cpu().numpy())
+                link_ids.append(lb.numpy())
+        link_ids = np.concatenate(link_ids)
+        y_pred = np.concatenate(preds) * std[link_ids] + mean[link_ids]
+        y_all = test_ds.values[test_ds.starts + seq_len, 0].numpy() * std[link_ids] + mean[link_ids]
+
+        for i in np.unique(link_ids):
+            sel = link_ids == i
+            y_true, y_hat = y_all[sel], y_pred[sel]
+            metrics[target][links[i]] = {
+                "mae": float(np.mean(np.abs(y_true - y_hat))),
+                "rmse": float(np.sqrt(np.mean((y_true - y_hat) ** 2))),
+                "smape": smape(y_true, y_hat),
+            }
 
-        for (src, dst), grp in df.groupby(["src_node", "dst_node"]):
-            train_vals = grp[grp["split"] == "train"][target]
-            val_vals = grp[grp["split"] == "val"][target]
-            test_vals = grp[grp["split"] == "test"][target]
+        torch.save(
+            {
+                "model_state": model.state_dict(),
+                "links": links,
+                "seq_len": seq_len,
+                "input_size": 1 + len(exog),
+                "embedding_dim": int(cfg.get("embedding_dim", 16)),
+                "hidden_size": int(cfg["hidden_size"]),
+                "num_layers": int(cfg["num_layers"]),
+                "exog": exog,
+                "exog_mean": exog_mean.tolist(),
+                "exog_std": exog_std.tolist(),
+                "target_mean": mean.tolist(),
+                "target_std": std.tolist(),
+            },
+            out_dir / f"{target}.pt",
+        )
+    return metrics
 
-            if len(train_vals) <= seq_len or len(test_vals) == 0:
-                continue
 
-            train_ds = to_sequences(train_vals, seq_len)
-            val_ds = to_sequences(val_vals, seq_len) if len(val_vals) > seq_len else None
-            test_ds = to_sequences(test_vals, seq_len)
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--params", default="params.yaml")
+    ap.add_argument("--mode", choices=["per_link", "global"], default=None, help="overrides lstm.mode")
+    ap.add_argument("--workers", type=int, default=None, help="overrides train.workers (per_link mode)")
+    args = ap.parse_args()
 
-            train_loader = DataLoader(train_ds, batch_size=int(cfg["batch_size"]), shuffle=True)
-            val_loader = DataLoader(val_ds, batch_size=int(cfg["batch_size"]), shuffle=False) if val_ds else None
-            test_loader = DataLoader(test_ds, batch_size=int(cfg["batch_size"]), shuffle=False)
+    params = read_params(Path(args.params))
 
-            model = LSTMReg(input_size=1, hidden_size=int(cfg["hidden_size"]), num_layers=int(cfg["num_layers"]))
-            model = train_model(model, train_loader, val_loader, epochs=int(cfg["epochs"]), lr=float(cfg["lr"]), device=device)
+    out_dir = Path("models/lstm")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    metrics_dir = Path("reports/metrics")
+    metrics_dir.mkdir(parents=True, exist_ok=True)
 
-            preds, truth = [], []
-            model.eval()
-            with torch.no_grad():
-                for xb, yb in test_loader:
-                    xb = xb.to(device)
-                    out = model(xb).cpu().numpy()
-                    preds.extend(out.tolist())
-                    truth.extend(yb.numpy().tolist())
-
-            y_true = np.array(truth)
-            y_pred = np.array(preds)[: len(y_true)]
-            mae = float(np.mean(np.abs(y_true - y_pred)))
-            rmse = float(np.sqrt(np.mean((y_true - y_pred) ** 2)))
-            metrics[target][f"{src}_{dst}"] = {
-                "mae": mae,
-                "rmse": rmse,
-                "smape": smape(y_true, y_pred),
-            }
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    targets = ["sum_energy_Wh", "sum_duration_s"]
 
-            torch.save(
-                {"model_state": model.state_dict(), "seq_len": seq_len},
-                target_dir / f"{src}_{dst}.pt",
-            )
+    mode = args.mode or params["lstm"].get("mode", "per_link")
+    if mode == "global":
+        metrics = train_global(params, targets, out_dir, device)
+    else:
+        workers = int(args.workers or params.get("train", {}).get("workers", 1))
+        metrics = train_per_link(params, targets, out_dir, device, workers=workers)
 
     with open(metrics_dir / "lstm.json", "w") as f:
         json.dump(metrics, f, indent=2)
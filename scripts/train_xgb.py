@@ -3,14 +3,18 @@ from __future__ import annotations
 
 import argparse
 import json
+import tempfile
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
+import pyarrow.compute as pc
 import xgboost as xgb
 import yaml
 
+from feature_store import iter_batches, read_splits
+
 
 def read_params(path: Path) -> dict:
     with open(path, "r") as f:
@@ -23,71 +27,225 @@ def smape(y_true: np.ndarray, y_pred: np.ndarray) -> float:
     return float(np.mean(np.abs(y_true - y_pred) / denom))
 
 
-def build_features(df: pd.DataFrame, target: str) -> (pd.DataFrame, np.ndarray):
+def build_features(df: pd.DataFrame, target: str, columns: Optional[List[str]] = None,
+                   vocab: Optional[Dict[str, List[str]]] = None) -> (pd.DataFrame, np.ndarray):
     drop_cols = {target, "split", "window_start_ts", "window_end_ts", "ingested_at_ts", "date"}
     X = df.drop(columns=[c for c in drop_cols if c in df.columns])
 
     # Remove any remaining datetime/timedelta columns to keep XGBoost happy.
-    datetime_cols = list(X.select_dtypes(include=["datetime64[ns]", "datetime64[ns, UTC]", "timedelta64[ns]"]).columns)
+    datetime_cols = list(X.select_dtypes(include=["datetime", "datetimetz", "timedelta"]).columns)
     if datetime_cols:
         X = X.drop(columns=datetime_cols)
 
-    X = pd.get_dummies(X, columns=["src_node", "dst_node"], drop_first=False)
+    # with the training links as categories every split (and batch) gets the same dummy columns
+    if vocab is not None:
+        X = X.assign(**{c: pd.Categorical(X[c], categories=vocab[c]) for c in ["src_node", "dst_node"]})
+    # float, not bool, dummies: bool columns become indicator splits, which the ONNX converter rejects
+    X = pd.get_dummies(X, columns=["src_node", "dst_node"], drop_first=False, dtype=float)
     X = X.fillna(0)
-    y = df[target].to_numpy()
+    if columns is not None:
+        X = X.reindex(columns=columns, fill_value=0)
+    y = df[target].to_numpy(dtype=np.float64)
     return X, y
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--params", default="params.yaml")
-    args = ap.parse_args()
+def link_vocab(df: pd.DataFrame) -> Dict[str, List[str]]:
+    return {c: sorted(df[c].dropna().unique().tolist()) for c in ["src_node", "dst_node"]}
 
-    params = read_params(Path(args.params))
-    df = pd.read_parquet(Path(params["data"]["features_path"]))
-    df.sort_values(["window_start_ts"], inplace=True)
 
-    out_dir = Path("models/xgb")
-    out_dir.mkdir(parents=True, exist_ok=True)
-    metrics_dir = Path("reports/metrics")
-    metrics_dir.mkdir(parents=True, exist_ok=True)
+def booster_params(xgb_params: dict) -> dict:
+    out = {
+        "objective": "reg:squarederror",
+        "tree_method": xgb_params.get("tree_method", "hist"),
+        "max_bin": int(xgb_params.get("max_bin", 256)),
+        "max_depth": int(xgb_params["max_depth"]),
+        "learning_rate": float(xgb_params["learning_rate"]),
+        "subsample": float(xgb_params["subsample"]),
+        "colsample_bytree": float(xgb_params["colsample_bytree"]),
+    }
+    if xgb_params.get("nthread"):
+        out["nthread"] = int(xgb_params["nthread"])
+    return out
+
+
+def dmatrix_args(xgb_params: dict) -> dict:
+    """Bins and thread count (null = all cores, like the booster) for every quantile DMatrix;
+    a val matrix built with ref=dtrain must use the same max_bin as the training one."""
+    out = {"max_bin": int(xgb_params.get("max_bin", 256))}
+    if xgb_params.get("nthread"):
+        out["nthread"] = int(xgb_params["nthread"])
+    return out
+
 
+def fit_booster(xgb_params: dict, dtrain: xgb.DMatrix, dval: Optional[xgb.DMatrix]) -> xgb.Booster:
+    """n_estimators rounds, or fewer with early stopping on val; the saved booster ends at the best round."""
+    rounds = int(xgb_params.get("early_stopping_rounds") or 0) if dval is not None else 0
+    booster = xgb.train(
+        booster_params(xgb_params),
+        dtrain,
+        num_boost_round=int(xgb_params["n_estimators"]),
+        evals=[(dval, "val")] if dval is not None else (),
+        early_stopping_rounds=rounds or None,
+        verbose_eval=False,
+    )
+    return booster[: booster.best_iteration + 1] if rounds else booster
+
+
+class SplitBatches(xgb.DataIter):
+    """One split fed to an external-memory DMatrix a Parquet batch at a time (rows with a label only)."""
+    def __init__(self, params: dict, split: str, target: str, columns: List[str], vocab: Dict[str, List[str]],
+                 batch_rows: int, cache_prefix: str):
+        super().__init__(cache_prefix=cache_prefix)
+        self.params, self.split, self.target = params, split, target
+        self.columns, self.vocab, self.batch_rows = columns, vocab, batch_rows
+        self._batches = None
+
+    def reset(self) -> None:
+        self._batches = None
+
+    def next(self, input_data) -> bool:
+        if self._batches is None:
+            self._batches = iter_batches(self.params, self.split, self.batch_rows)
+        for batch in self._batches:
+            X, y = build_features(batch.to_pandas(), self.target, self.columns, self.vocab)
+            ok = np.isfinite(y)
+            if ok.any():
+                input_data(data=X.loc[ok], label=y[ok])
+                return True
+        return False
+
+
+def metrics_for(y_true: np.ndarray, preds: np.ndarray) -> dict:
+    return {
+        "mae": float(np.mean(np.abs(y_true - preds))),
+        "rmse": float(np.sqrt(np.mean((y_true - preds) ** 2))),
+        "smape": smape(y_true, preds),
+    }
+
+
+def train_in_memory(params: dict, targets: List[str], out_dir: Path) -> Dict[str, Dict]:
     xgb_params = params["xgb"]
-    targets = ["sum_energy_Wh", "sum_duration_s"]
+    # the feature store keeps splits in (link, time) order; XGBoost gets them in time order as before.
+    # The sort and build_features copy each split onto the heap: the memory-mapped store only saves
+    # the Parquet decode here (xgb.external_memory bounds the footprint instead)
+    splits = read_splits(params, ["train", "val", "test"])
+    splits = {s: df.sort_values(["window_start_ts"], kind="stable") for s, df in splits.items()}
+    vocab = link_vocab(splits["train"])
     metrics: Dict[str, Dict] = {}
 
     for target in targets:
-        train_df = df[df["split"] == "train"]
-        test_df = df[df["split"] == "test"]
-        if len(train_df) < 10 or len(test_df) < 1:
+        X_train, y_train = build_features(splits["train"], target, vocab=vocab)
+        columns = list(X_train.columns)
+        X_val, y_val = build_features(splits["val"], target, columns, vocab)
+        X_test, y_test = build_features(splits["test"], target, columns, vocab)
+        # windows without a label (no traffic in that window) cannot be fitted or scored
+        train_ok, val_ok, test_ok = np.isfinite(y_train), np.isfinite(y_val), np.isfinite(y_test)
+        if train_ok.sum() < 10 or test_ok.sum() < 1:
             continue
 
-        X_train, y_train = build_features(train_df, target)
-        X_test, y_test = build_features(test_df, target)
+        # QuantileDMatrix bins the frame directly, without a float copy of it; val reuses the train bins
+        dtrain = xgb.QuantileDMatrix(X_train.loc[train_ok], y_train[train_ok], **dmatrix_args(xgb_params))
+        dval = xgb.QuantileDMatrix(X_val.loc[val_ok], y_val[val_ok], ref=dtrain, **dmatrix_args(xgb_params)) \
+            if val_ok.any() else None
+        booster = fit_booster(xgb_params, dtrain, dval)
+        preds = booster.inplace_predict(X_test.loc[test_ok])
 
-        model = xgb.XGBRegressor(
-            max_depth=int(xgb_params["max_depth"]),
-            n_estimators=int(xgb_params["n_estimators"]),
-            learning_rate=float(xgb_params["learning_rate"]),
-            subsample=float(xgb_params["subsample"]),
-            colsample_bytree=float(xgb_params["colsample_bytree"]),
-            objective="reg:squarederror",
-        )
-        model.fit(X_train, y_train)
-        preds = model.predict(X_test)
-
-        mae = float(np.mean(np.abs(y_test - preds)))
-        rmse = float(np.sqrt(np.mean((y_test - preds) ** 2)))
         metrics[target] = {
-            "mae": mae,
-            "rmse": rmse,
-            "smape": smape(y_test, preds),
-            "n_train": len(train_df),
-            "n_test": len(test_df),
-            "feature_names": list(X_train.columns),
+            **metrics_for(y_test[test_ok], preds),
+            "n_train": int(train_ok.sum()),
+            "n_val": int(val_ok.sum()),
+            "n_test": int(test_ok.sum()),
+            "best_iteration": booster.num_boosted_rounds() - 1,
+            "feature_names": columns,
         }
+        booster.save_model(out_dir / f"{target}.json")
+    return metrics
+
 
-        model.save_model(out_dir / f"{target}.json")
+def labelled_rows(params: dict, split: str, target: str, batch_rows: int) -> int:
+    return sum(int(pc.sum(pc.is_finite(b.column(0))).as_py() or 0)
+               for b in iter_batches(params, split, batch_rows, columns=[target]))
+
+
+def fit_external(params: dict, target: str, columns: List[str], vocab: Dict[str, List[str]], batch_rows: int,
+                 cache: str) -> Optional[Dict]:
+    xgb_params = params["xgb"]
+    # an iterator without a single batch cannot make a DMatrix: count the labelled rows first
+    if labelled_rows(params, "train", target, batch_rows) < 10:
+        return None
+    dtrain = xgb.ExtMemQuantileDMatrix(
+        SplitBatches(params, "train", target, columns, vocab, batch_rows, f"{cache}/{target}-train"),
+        **dmatrix_args(xgb_params),
+    )
+    dval = None
+    if labelled_rows(params, "val", target, batch_rows):
+        dval = xgb.ExtMemQuantileDMatrix(
+            SplitBatches(params, "val", target, columns, vocab, batch_rows, f"{cache}/{target}-val"), ref=dtrain,
+            **dmatrix_args(xgb_params),
+        )
+    booster = fit_booster(xgb_params, dtrain, dval)
+
+    truth, preds = [], []
+    for batch in iter_batches(params, "test", batch_rows):
+        X, y = build_features(batch.to_pandas(), target, columns, vocab)
+        ok = np.isfinite(y)
+        if ok.any():
+            truth.append(y[ok])
+            preds.append(booster.inplace_predict(X.loc[ok]))
+    if not truth:
+        return None
+    return {
+        "booster": booster,
+        **metrics_for(np.concatenate(truth), np.concatenate(preds)),
+        "n_train": int(dtrain.num_row()),
+        "n_val": int(dval.num_row()) if dval is not None else 0,
+        "n_test": int(sum(len(t) for t in truth)),
+        "best_iteration": booster.num_boosted_rounds() - 1,
+        "feature_names": columns,
+    }
+
+
+def train_external(params: dict, targets: List[str], out_dir: Path) -> Dict[str, Dict]:
+    """Same model from Parquet batches: quantised pages are cached on disk instead of holding the splits."""
+    xgb_params = params["xgb"]
+    batch_rows = int(xgb_params.get("batch_rows", 262144))
+    links = pd.concat([b.to_pandas() for b in iter_batches(params, "train", batch_rows, columns=["src_node", "dst_node"])])
+    if links.empty:
+        return {}
+    vocab = link_vocab(links)
+    first = next(iter_batches(params, "train", 1)).to_pandas()
+    metrics: Dict[str, Dict] = {}
+
+    # the DMatrices live in fit_external, so their cache pages are released before the directory goes
+    with tempfile.TemporaryDirectory(dir=xgb_params.get("cache_dir")) as cache:
+        for target in targets:
+            columns = list(build_features(first, target, vocab=vocab)[0].columns)
+            result = fit_external(params, target, columns, vocab, batch_rows, cache)
+            if result is None:
+                continue
+            result.pop("booster").save_model(out_dir / f"{target}.json")
+            metrics[target] = result
+    return metrics
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--params", default="params.yaml")
+    ap.add_argument("--external-memory", action="store_true", help="overrides xgb.external_memory")
+    args = ap.parse_args()
+
+    params = read_params(Path(args.params))
+
+    out_dir = Path("models/xgb")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    metrics_dir = Path("reports/metrics")
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+
+    targets = ["sum_energy_Wh", "sum_duration_s"]
+    if args.external_memory or params["xgb"].get("external_memory", False):
+        metrics = train_external(params, targets, out_dir)
+    else:
+        metrics = train_in_memory(params, targets, out_dir)
 
     with open(metrics_dir / "xgb.json", "w") as f:
         json.dump(metrics, f, indent=2)
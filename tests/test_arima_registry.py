@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("statsmodels")
+
+from statsmodels.tsa.arima.model import ARIMA  # noqa: E402
+
+from ingest.model_registry import ModelRegistry  # noqa: E402
+from ingest.predictors import ArimaForecaster, ArimaObservations  # noqa: E402
+
+
+def _series(seed: int, n: int = 120) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return 50.0 + np.cumsum(rng.normal(0.0, 1.0, n)) * 0.1 + rng.normal(0.0, 1.0, n)
+
+
+@pytest.fixture
+def models(tmp_path):
+    for seed, link in enumerate(["a_b", "c_d"]):
+        path = tmp_path / "arima" / "sum_energy_Wh" / f"{link}.pkl"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        ARIMA(_series(seed), order=(1, 0, 1)).fit().save(path)
+    return tmp_path
+
+
+def _registry(models_dir, observations):
+    loaders = {"arima": (".pkl", lambda path: ArimaForecaster(path, observations))}
+    return ModelRegistry(models_dir, loaders, max_loaded=1)
+
+
+def test_appended_observations_survive_eviction(models):
+    registry = _registry(models, ArimaObservations())
+    new = [55.0, 56.5, 54.2]
+    model = registry.get("arima", "sum_energy_Wh", "a", "b")
+    trained = model.forecast(6)
+    assert model.observe(new) == 3
+    appended = model.forecast(6)
+    assert appended != trained
+
+    registry.get("arima", "sum_energy_Wh", "c", "d")  # max_loaded=1: evicts a_b
+    assert registry.evictions == 1
+    reloaded = registry.get("arima", "sum_energy_Wh", "a", "b")
+    assert reloaded is not model
+    assert reloaded.appended == 3
+    np.testing.assert_allclose(reloaded.forecast(6), appended)
+
+    # observations after the reload continue the same state
+    assert reloaded.observe([53.0]) == 4
+    expected = model.results.extend(np.array([53.0])).forecast(steps=6)
+    np.testing.assert_allclose(reloaded.forecast(6), expected)
+
+
+def test_refresh_keeps_observations_until_the_artefact_is_retrained(models):
+    registry = _registry(models, ArimaObservations())
+    model = registry.get("arima", "sum_energy_Wh", "a", "b")
+    model.observe([55.0, 56.5])
+    appended = model.forecast(3)
+
+    registry.refresh()  # unchanged file: the loaded model stays
+    assert registry.get("arima", "sum_energy_Wh", "a", "b").forecast(3) == appended
+
+    path = models / "arima" / "sum_energy_Wh" / "a_b.pkl"
+    ARIMA(_series(7), order=(1, 0, 1)).fit().save(path)
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+    registry.refresh()
+    retrained = registry.get("arima", "sum_energy_Wh", "a", "b")
+    assert retrained.appended == 0
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+import make_features  # noqa: E402
+import train_xgb  # noqa: E402
+
+
+def _features(tmp_path, links: int = 4, hours: int = 240):
+    rng = np.random.default_rng(0)
+    ts = pd.date_range("2023-01-01", periods=hours, freq="1h")
+    n = links * hours
+    gold = pd.DataFrame({
+        "src_node": np.repeat([f"n{i}" for i in range(links)], hours),
+        "dst_node": np.repeat([f"m{i}" for i in range(links)], hours),
+        "window_start_ts": np.tile(ts.values, links),
+        "sum_energy_Wh": rng.gamma(2.0, 20.0, n),
+        "sum_duration_s": rng.gamma(2.0, 5.0, n),
+    })
+    gold["window_end_ts"] = gold["window_start_ts"] + pd.Timedelta("1h")
+    gold.to_parquet(tmp_path / "gold.parquet", index=False)
+    params = {
+        "data": {"gold_path": str(tmp_path / "gold.parquet"), "features_path": str(tmp_path / "features.parquet"),
+                 "columns": None, "date_from": None, "date_to": None},
+        "features": {"max_lag": 3, "rolling": 4, "kpi_path": None, "store_path": None},
+        "split": {"mode": "per_link", "train_frac": 0.7, "val_frac": 0.1, "test_frac": 0.2},
+    }
+    make_features.build_features(params)
+    return params
+
+
+@pytest.mark.parametrize("external_memory", [False, True])
+def test_non_default_max_bin_trains_with_val_early_stopping(tmp_path, external_memory):
+    params = _features(tmp_path)
+    params["xgb"] = {
+        "max_depth": 3, "n_estimators": 20, "learning_rate": 0.1, "subsample": 1.0, "colsample_bytree": 1.0,
+        "tree_method": "hist", "max_bin": 64, "nthread": 1, "early_stopping_rounds": 5,
+        "batch_rows": 256, "cache_dir": str(tmp_path),
+    }
+    out_dir = tmp_path / "models"
+    out_dir.mkdir()
+    train = train_xgb.train_external if external_memory else train_xgb.train_in_memory
+    metrics = train(params, ["sum_energy_Wh"], out_dir)
+
+    m = metrics["sum_energy_Wh"]
+    assert m["n_val"] > 0 and m["n_test"] > 0
+    assert np.isfinite(m["rmse"])
+    booster = xgb.Booster(model_file=str(out_dir / "sum_energy_Wh.json"))
+    assert booster.num_boosted_rounds() == m["best_iteration"] + 1